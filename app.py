@@ -7,9 +7,10 @@ import json
 from pathlib import Path
 import os
 import numpy as np
-from screendoc import ScreenRecorder, StepDetector, DocumentationGenerator
+from screendoc import ScreenRecorder, StepDetector, DocumentationGenerator, TimestampIndex
+from screendoc.jobs import FinalizeJob
+from screendoc.screen_recorder import transcode_to_mp4
 import time
-import tempfile
 import cv2
 
 # Page config
@@ -72,35 +73,25 @@ def load_lottie_url(url: str):
         return None
     return r.json()
 
-def process_video(video_file):
-    # Създаваме временен файл за каченото видео
-    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-        temp_file.write(video_file.read())  # Записваме каченото видео
-        temp_file_path = temp_file.name  # Вземаме пътя до временния файл
+def process_video(video_path):
+    """Build the frame timestamp index of an uploaded video.
 
-    # Отваряме видеото с OpenCV
-    cap = cv2.VideoCapture(temp_file_path)
-    
-    if not cap.isOpened():
-        st.error("Не може да се отвори видео файла.")
-        return []
-    
-    timestamps = []  # Списък за времеви печати на кадрите
-    frame_rate = cap.get(cv2.CAP_PROP_FPS)  # Получаваме FPS (кадри в секунда)
-    
-    # Четене на кадрите от видеото
-    while True:
-        ret, frame = cap.read()  # Четем следващия кадър
-        if not ret:
-            break  # Ако няма повече кадри, прекратяваме цикъла
-        
-        timestamp = time.time()  # Вземаме текущото време
-        timestamps.append(timestamp)  # Добавяме времевия печат в списъка
+    Timestamps are read from the container metadata, so the frames do not
+    have to be decoded.
+    """
+    return TimestampIndex.from_video(str(video_path))
 
-    # Затваряме видеото след обработката
-    cap.release()
+def make_web_copy(job, video_path, duration):
+    """Convert an uploaded video to H.264 MP4 for the browser (runs on the worker pool).
+
+    Returns:
+        Tuple[str, TimestampIndex]: Path of the copy and its frame timestamps
+    """
+    web_path = str(Path(video_path).with_suffix("")) + "_web.mp4"
+    transcode_to_mp4(str(video_path), web_path, preset="veryfast", duration=duration,
+                     on_progress=job.update)
+    return web_path, process_video(web_path)
 
-    return timestamps
 # Initialize session state variables
 if 'recording' not in st.session_state:
     st.session_state.recording = False
@@ -118,6 +109,25 @@ if 'recording_thread' not in st.session_state:
     st.session_state.recording_thread = None
 if 'doc_path' not in st.session_state:
     st.session_state.doc_path = None
+if 'finalize_job' not in st.session_state:
+    st.session_state.finalize_job = None
+
+# Pick up a recording whose background conversion has finished
+if st.session_state.finalize_job is not None and st.session_state.finalize_job.done():
+    job = st.session_state.finalize_job
+    st.session_state.finalize_job = None
+    if job.error is not None:
+        st.error(f"Could not convert video: {str(job.error)}")
+    else:
+        video_path, timestamps = job.result()
+        if video_path:
+            # Steps detected on the raw recording now read from the final video
+            job.release_raw(st.session_state.steps)
+            st.session_state.output_path = video_path
+            st.session_state.timestamps = timestamps
+            st.success(f"Recording saved successfully!")
+        else:
+            st.error("No frames were recorded. Please try again.")
 
 # Create output directories
 output_dir = Path("output")
@@ -162,54 +172,77 @@ if selected == "Record":
         st.title("Upload and Display Video")
         # File uploader widget to upload a video
         video_file = st.file_uploader("Choose a video...", type=["mp4", "mov", "avi", "mkv"])
-        if video_file is not None:
-          timestamps = process_video(video_file)  # Извикваме функцията за обработка на видеото
-        video_path = recordings_dir / "temp.avi" 
-        if video_file:
+        # Streamlit reruns the script on every interaction; only ingest a new upload once
+        if video_file and st.session_state.get('uploaded_video') != (video_file.name, video_file.size):
+          suffix = Path(video_file.name).suffix.lower()
+          video_path = recordings_dir / f"upload_{time.strftime('%Y%m%d_%H%M%S')}{suffix}"
           with open(video_path, "wb") as f:
               f.write(video_file.getbuffer())
 
-          with st.spinner("Convert video"):
-            recorder = ScreenRecorder(str(recordings_dir))
-            st.session_state.recorder = recorder
-            st.session_state.recording = False
-            video_file, timestamps1 = st.session_state.recorder.stop_recording()
-            st.session_state.output_path = video_file
-            st.session_state.timestamps = timestamps
+          # Steps are detected on the uploaded file itself; only its timestamps
+          # are read up front, from the container metadata
+          timestamps = process_video(video_path)
+          st.session_state.output_path = str(video_path)
+          st.session_state.timestamps = timestamps
+          st.session_state.uploaded_video = (video_file.name, video_file.size)
+          if suffix != ".mp4":
+              # Browsers may not play other containers; convert a copy in the background
+              duration = float(timestamps[-1] - timestamps[0]) if len(timestamps) else None
+              st.session_state.finalize_job = FinalizeJob(make_web_copy, video_path, duration)
+
+        # Conversion progress of the last recording
+        if st.session_state.finalize_job is not None:
+            st.progress(st.session_state.finalize_job.progress, text="Converting video...")
+            time.sleep(0.5)
+            st.rerun()
 
         # Recording controls
         if not st.session_state.recording:
             if st.button("Start Recording", key="start_recording"):
                 st.session_state.recording = True
-                # Initialize recorder with proper output directory
-                recorder = ScreenRecorder(str(recordings_dir))
+                # Initialize recorder with proper output directory and detect
+                # steps while recording so they are ready when it stops
+                detector = StepDetector(
+                    similarity_threshold=st.session_state.get('similarity_threshold', 0.85),
+                    min_time_between_steps=st.session_state.get('min_time_between', 1.0)
+                )
+                # Screenshots are saved as steps are confirmed during recording
+                recorded_screenshots = {}
+                def save_step(step, paths=recorded_screenshots, detector=detector):
+                    paths[len(paths)] = detector.save_screenshot(step, len(paths), str(screenshots_dir))
+                st.session_state.recorded_screenshots = recorded_screenshots
+                recorder = ScreenRecorder(str(recordings_dir), step_detector=detector,
+                                          segment_seconds=60,
+                                          fps=st.session_state.get('fps', 30),
+                                          quality=st.session_state.get('quality', 80),
+                                          on_step=save_step)
                 st.session_state.recorder = recorder
                 # Start recording in a separate thread
-                import threading
-                recording_thread = threading.Thread(target=recorder.start_recording, daemon=True)
-                recording_thread.start()
-                st.session_state.recording_thread = recording_thread
+                st.session_state.recording_thread = recorder.start_recording_async()
                 st.rerun()
         else:
             if st.button("Stop Recording", key="stop_recording"):
-                with st.spinner("Convert video"):
                   try:  
                     if st.session_state.recorder:
                         st.session_state.recording = False
-                        # Stop recording and save
-                        video_path, timestamps = st.session_state.recorder.stop_recording()
-                        if video_path:
-                            st.session_state.output_path = video_path
-                            st.session_state.timestamps = timestamps
-                            st.success(f"Recording saved successfully!")
-                        else:
-                            st.error("No frames were recorded. Please try again.")
+                        # Stop recording; the video is converted in the background
+                        job = st.session_state.recorder.stop_recording_async(keep_raw=True)
+                        st.session_state.finalize_job = job
+                        if job.raw_path:
+                            # Step detection can run on the raw file while it converts
+                            st.session_state.output_path = job.raw_path
+                            st.session_state.timestamps = job.raw_timestamps
+                        steps = st.session_state.recorder.detected_steps
+                        if steps:
+                            st.session_state.steps = steps
+                            st.session_state.screenshot_paths = dict(st.session_state.recorded_screenshots)
+                            st.session_state.selected_steps = list(range(len(steps)))
                         # Clean up
                         st.session_state.recorder = None
                         st.session_state.recording_thread = None
                         st.rerun()
                   except Exception as e2:
-                    st.error(f"Could not convert video: {str(e2)}")
+                    st.error(f"Could not stop recording: {str(e2)}")
      
     
     with col2:
@@ -288,16 +321,24 @@ elif selected == "Review":
                 with st.spinner("Detecting steps..."):
                     detector = StepDetector(
                         similarity_threshold=similarity_threshold,
-                        min_time_between_steps=min_time_between
+                        min_time_between_steps=min_time_between,
+                        workers=None,
+                        cache_signal=True
                     )
-                    steps = detector.detect_steps(str(video_path), st.session_state.timestamps)
+                    # Save each screenshot as soon as its step is confirmed
+                    steps = []
+                    screenshot_paths = {}
+                    progress = st.empty()
+                    for step in detector.iter_steps(str(video_path), st.session_state.timestamps):
+                        screenshot_paths[len(steps)] = detector.save_screenshot(step, len(steps), str(screenshots_dir))
+                        steps.append(step)
+                        progress.text(f"Found {len(steps)} steps so far...")
+                    progress.empty()
                     
                     # Save detection parameters
                     st.session_state.similarity_threshold = similarity_threshold
                     st.session_state.min_time_between = min_time_between
                     
-                    # Save screenshots
-                    screenshot_paths = detector.save_screenshots(steps, str(screenshots_dir))
                     st.session_state.steps = steps
                     st.session_state.screenshot_paths = screenshot_paths
                     st.success(f"Detected {len(steps)} steps!")
@@ -411,10 +452,25 @@ elif selected == "Generate":
                 key="template"
             )
             
+            structured_option = st.checkbox(
+                "One request per step",
+                value=False,
+                key="structured",
+                help="Ask for each step's description, result and transition in a single request. Faster and uses less quota."
+            )
+            
+            crop_option = st.checkbox(
+                "Send only changed regions",
+                value=False,
+                key="crop_to_changes",
+                help="Crop screenshots to the part of the screen that changed before sending them for description."
+            )
+            
             if st.button("Generate Documentation"):
                 with st.spinner("Generating documentation..."):
                     try:
-                        generator = DocumentationGenerator()
+                        generator = DocumentationGenerator(structured=structured_option,
+                                                           crop_to_changes=crop_option)
                         doc_path = generator.generate_documentation(
                             st.session_state.steps,
                             st.session_state.screenshot_paths,
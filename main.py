@@ -1,5 +1,6 @@
 import argparse
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from screendoc import ScreenRecorder, StepDetector, DocumentationGenerator
 
 def main():
@@ -10,36 +11,110 @@ def main():
                        default="markdown", help="Output documentation format")
     parser.add_argument("--monitor", type=int, default=1,
                        help="Monitor number to record (default: 1)")
+    parser.add_argument("--change-threshold", type=float, default=None,
+                       help="Only record frames that differ from the last kept one "
+                            "by this mean pixel difference (0-255)")
+    parser.add_argument("--region", type=str, default=None,
+                       help="Capture only this screen rectangle, given as LEFT,TOP,WIDTH,HEIGHT")
+    parser.add_argument("--window", type=str, default=None,
+                       help="Capture only the window whose title contains this text")
+    parser.add_argument("--scale", type=float, default=1.0,
+                       help="Downscale factor for captured frames (e.g. 0.5)")
+    parser.add_argument("--fps", type=float, default=30.0,
+                       help="Target capture frame rate (lowered automatically if the machine cannot keep up)")
+    parser.add_argument("--quality", type=int, default=80,
+                       help="Encoding quality from 1 to 100")
+    parser.add_argument("--screenshot-format", type=str, choices=["png", "jpeg", "webp"], default="png",
+                       help="Image format of step screenshots")
+    parser.add_argument("--screenshot-quality", type=int, default=None,
+                       help="PNG compression level (0-9) or JPEG/WebP quality (1-100); "
+                            "WebP is lossless if omitted")
+    parser.add_argument("--screenshot-max-size", type=int, default=None,
+                       help="Scale screenshots down to at most this many pixels on their longest edge")
+    parser.add_argument("--structured", action="store_true",
+                       help="Describe each step with a single structured request instead of three")
+    parser.add_argument("--upload-max-size", type=int, default=1600,
+                       help="Scale screenshots sent for description down to at most this many pixels "
+                            "on their longest edge (0 to keep their resolution)")
+    parser.add_argument("--crop-to-changes", action="store_true",
+                       help="Send only the changed part of the screen for description when it is small")
+    parser.add_argument("--segment-seconds", type=float, default=60.0,
+                       help="Length of recording segments in seconds (0 for a single file)")
     args = parser.parse_args()
+    if args.format == "pdf" and args.screenshot_format == "webp":
+        parser.error("WebP screenshots cannot be embedded in PDF documentation")
     
     # Create output directory
     output_dir = Path(args.output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
     
+    region = None
+    if args.window:
+        region = ScreenRecorder.window_region(args.window)
+    elif args.region:
+        region = tuple(int(v) for v in args.region.split(","))
+    
     # Initialize components
-    recorder = ScreenRecorder(str(output_dir / "recordings"))
     detector = StepDetector()
-    generator = DocumentationGenerator()
+    generator = DocumentationGenerator(structured=args.structured,
+                                       max_image_edge=args.upload_max_size or None,
+                                       crop_to_changes=args.crop_to_changes)
+    
+    # Save screenshots and request descriptions as steps are detected, while
+    # recording continues
+    screenshots_dir = output_dir / "screenshots"
+    screenshot_paths = {}
+    descriptions = {}
+    describer = ThreadPoolExecutor(max_workers=generator.max_concurrency)
+    
+    def on_step(step):
+        idx = len(screenshot_paths)
+        screenshot_paths[idx] = detector.save_screenshot(step, idx, str(screenshots_dir),
+                                                         image_format=args.screenshot_format,
+                                                         quality=args.screenshot_quality,
+                                                         max_size=args.screenshot_max_size)
+        descriptions[idx] = describer.submit(generator.generate_step_description,
+                                             screenshot_paths[idx], screenshot_paths.get(idx - 1),
+                                             step.change_regions)
+    
+    recorder = ScreenRecorder(str(output_dir / "recordings"),
+                              change_threshold=args.change_threshold,
+                              step_detector=detector,
+                              region=region,
+                              scale=args.scale,
+                              segment_seconds=args.segment_seconds or None,
+                              fps=args.fps,
+                              quality=args.quality,
+                              on_step=on_step)
     
     try:
         print("Starting screen recording... Press Ctrl+C to stop.")
         recorder.start_recording(args.monitor)
     except KeyboardInterrupt:
         print("\nStopping recording...")
+    # Recording also ends on its own if the encoder fails
+    try:
         video_path, timestamps = recorder.stop_recording()
+    except RuntimeError as e:
+        print(f"\n{e}")
+        describer.shutdown(cancel_futures=True)
+        return
         
-        if video_path:
-            print(f"\nRecording saved to: {video_path}")
-            print("Detecting steps...")
-            steps = detector.detect_steps(video_path, timestamps)
-            
-            print(f"Detected {len(steps)} steps")
-            print("Saving screenshots...")
-            screenshot_paths = detector.save_screenshots(steps, str(output_dir / "screenshots"))
-            
-            print("Generating documentation...")
-            doc_path = generator.generate_documentation(steps, screenshot_paths, args.format)
-            print(f"\nDocumentation generated: {doc_path}")
+    if video_path:
+        print(f"\nRecording saved to: {video_path}")
+        # Steps were detected while recording
+        steps = recorder.detected_steps
+        
+        print(f"Detected {len(steps)} steps")
+        print("Waiting for step descriptions...")
+        for idx, step in enumerate(steps):
+            step.description = descriptions[idx].result()
+        describer.shutdown()
+        
+        print("Generating documentation...")
+        doc_path = generator.generate_documentation(steps, screenshot_paths, args.format,
+                                                    describe=False)
+        print(f"\nDocumentation generated: {doc_path}")
             
 if __name__ == "__main__":
     main()
@@ -1,5 +1,6 @@
 from .screen_recorder import ScreenRecorder
 from .step_detector import StepDetector
 from .documentation_generator import DocumentationGenerator
+from .timestamp_index import TimestampIndex
 
 __version__ = "0.1.0"
@@ -0,0 +1,214 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Optional, Union
+
+# Input tokens Gemini counts for each image in a request
+IMAGE_TOKENS = 258
+
+
+class DescriptionBackend(ABC):
+    """Model that step descriptions are requested from.
+
+    ``generate_content`` takes a prompt, or a list of prompt text and image
+    parts (dicts with "mime_type" and "data"), and returns a response with a
+    ``text`` attribute and, optionally, ``usage_metadata.prompt_token_count``.
+    Errors meaning the quota was exceeded should be recognisable by
+    ``request_limits.is_rate_limit_error``. Backends whose responses should
+    not be kept in the response cache set ``cacheable`` to False.
+    """
+
+    model_name = ""
+    cacheable = True
+
+    @abstractmethod
+    def generate_content(self, contents: Union[str, list], generation_config: Optional[dict] = None):
+        """Send a request to the model.
+
+        Args:
+            contents (Union[str, list]): Prompt, or list of prompt and images
+            generation_config (Optional[dict]): Generation options, e.g.
+                {"response_mime_type": "application/json"}
+
+        Returns:
+            Response with ``text`` and ``usage_metadata``
+        """
+
+
+class GeminiBackend(DescriptionBackend):
+    """Google Gemini through the ``google.generativeai`` package."""
+
+    def __init__(self, model_name: Optional[str] = None, api_key: Optional[str] = None):
+        """Configure the Gemini client.
+
+        Args:
+            model_name (Optional[str]): Model to use; defaults to the MODEL_NAME
+                environment variable
+            api_key (Optional[str]): API key; defaults to the GEMINI_API_KEY
+                environment variable
+        """
+        import google.generativeai as genai
+        genai.configure(api_key=api_key or os.getenv("GEMINI_API_KEY"))
+        self.model_name = model_name or os.getenv("MODEL_NAME", "gemini-vision-1.5")
+        self.model = genai.GenerativeModel(self.model_name)
+
+    def generate_content(self, contents: Union[str, list], generation_config: Optional[dict] = None):
+        if generation_config:
+            return self.model.generate_content(contents, generation_config=generation_config)
+        return self.model.generate_content(contents)
+
+
+class StubError(Exception):
+    """Error raised by ``StubBackend``; ``code`` is 429 for simulated quota errors."""
+
+    def __init__(self, message: str, code: int):
+        super().__init__(message)
+        self.code = code
+
+
+class StubUsage:
+    __slots__ = ("prompt_token_count",)
+
+    def __init__(self, prompt_token_count: int):
+        self.prompt_token_count = prompt_token_count
+
+
+class StubResponse:
+    __slots__ = ("text", "usage_metadata")
+
+    def __init__(self, text: str, prompt_token_count: int):
+        self.text = text
+        self.usage_metadata = StubUsage(prompt_token_count)
+
+
+class StubBackend(DescriptionBackend):
+    """Offline stand-in for the model, for load testing and CI.
+
+    Responses are derived from a hash of the request, so the same request
+    always gets the same answer. Latency, failures and quota errors are
+    simulated from a seeded random generator: with the same seed and the same
+    order of requests, the same requests fail. Responses are never cached,
+    so repeated runs measure the pipeline rather than cache hits.
+    """
+
+    model_name = "stub"
+    cacheable = False
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.0, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, requests_per_minute: Optional[float] = None,
+                 seed: int = 0):
+        """Initialize the stub.
+
+        Args:
+            latency (float): Seconds each request takes
+            jitter (float): Extra random latency of up to this many seconds
+            error_rate (float): Fraction of requests failing with a server error (500)
+            rate_limit_rate (float): Fraction of requests rejected with a quota error (429)
+            requests_per_minute (Optional[float]): Simulated quota; requests
+                beyond it within any minute are rejected with a quota error
+            seed (int): Seed of the random generator
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.requests_per_minute = requests_per_minute
+        self.calls = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._recent = deque()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "StubBackend":
+        """Create a stub configured by the STUB_LATENCY, STUB_JITTER,
+        STUB_ERROR_RATE, STUB_RATE_LIMIT_RATE, STUB_RPM and STUB_SEED
+        environment variables."""
+        rpm = os.getenv("STUB_RPM")
+        return cls(latency=float(os.getenv("STUB_LATENCY", "0.5")),
+                   jitter=float(os.getenv("STUB_JITTER", "0")),
+                   error_rate=float(os.getenv("STUB_ERROR_RATE", "0")),
+                   rate_limit_rate=float(os.getenv("STUB_RATE_LIMIT_RATE", "0")),
+                   requests_per_minute=float(rpm) if rpm else None,
+                   seed=int(os.getenv("STUB_SEED", "0")))
+
+    def generate_content(self, contents: Union[str, list], generation_config: Optional[dict] = None):
+        parts = contents if isinstance(contents, list) else [contents]
+        with self._lock:
+            self.calls += 1
+            now = time.monotonic()
+            if self.requests_per_minute:
+                while self._recent and now - self._recent[0] >= 60.0:
+                    self._recent.popleft()
+                over_quota = len(self._recent) >= self.requests_per_minute
+                if not over_quota:
+                    self._recent.append(now)
+            else:
+                over_quota = False
+            roll = self._random.random()
+            delay = self.latency + self._random.random() * self.jitter
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+        try:
+            if over_quota or roll < self.rate_limit_rate:
+                with self._lock:
+                    self.rate_limited += 1
+                raise StubError("429 Resource has been exhausted (e.g. check quota).", 429)
+            time.sleep(delay)
+            if roll < self.rate_limit_rate + self.error_rate:
+                with self._lock:
+                    self.errors += 1
+                raise StubError("500 An internal error has occurred.", 500)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part["data"] if isinstance(part, dict) else str(part).encode())
+        tag = digest.hexdigest()[:8]
+        if generation_config and generation_config.get("response_mime_type") == "application/json":
+            text = json.dumps({
+                "description": f"Stub description {tag}.\n\nThe screen changed.",
+                "result": f"Stub result {tag}.",
+                "transition": f"Stub transition {tag}." if len(parts) > 2 else ""
+            })
+        elif len(parts) > 1:
+            text = f"Stub description {tag}.\n\nThe screen changed."
+        else:
+            text = f"Stub response {tag}."
+        tokens = sum(len(part) // 4 if isinstance(part, str) else IMAGE_TOKENS for part in parts)
+        return StubResponse(text, tokens)
+
+    def __str__(self) -> str:
+        return (f"{self.calls} calls, {self.errors} errors, {self.rate_limited} rate limited, "
+                f"{self.max_in_flight} most in flight")
+
+
+def create_backend(name: Optional[str] = None) -> DescriptionBackend:
+    """Create a description backend by name.
+
+    Args:
+        name (Optional[str]): "gemini" or "stub"; defaults to the
+            SCREENDOC_BACKEND environment variable, then "gemini"
+
+    Returns:
+        DescriptionBackend: The backend
+
+    Raises:
+        ValueError: If the name is unknown
+    """
+    name = (name or os.getenv("SCREENDOC_BACKEND", "gemini")).lower()
+    if name == "gemini":
+        return GeminiBackend()
+    if name == "stub":
+        return StubBackend.from_env()
+    raise ValueError(f"Unknown description backend: {name}")
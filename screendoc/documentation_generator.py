@@ -1,17 +1,50 @@
 import os
+import json
 from dotenv import load_dotenv
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional, Sequence, Union
 from PIL import Image
-import google.generativeai as genai
 from fpdf import FPDF
-from io import BytesIO
 import markdown
 import pdfkit
 import time
 import re
+from concurrent.futures import ThreadPoolExecutor
 from .step_detector import Step
+from .request_limits import RequestLimiter, backoff_delay, is_rate_limit_error
+from .response_cache import ResponseCache
+from .image_prep import ImagePreparer, change_crop
+from .backends import IMAGE_TOKENS, DescriptionBackend, create_backend
+
+CHANGE_PROMPT = """Analyze these two consecutive screenshots from a process documentation and:
+1. Describe what changed between the previous and current screen
+2. Explain the user's action that likely caused this change
+3. Identify any important UI elements or data that were modified
+4. Note any system responses or feedback shown
+5. Highlight any potential dependencies or prerequisites for this step
+
+Focus on being specific and actionable. Use clear, professional language.
+Previous screenshot shows the starting state, current screenshot shows the result."""
+
+SCREEN_PROMPT = """Analyze this screenshot from a process documentation and:
+1. Describe the current state of the application/screen
+2. Identify key UI elements and their purpose
+3. Note any important data or settings shown
+4. Highlight any system status or feedback messages
+5. Suggest what actions might be available or required
+
+Focus on being specific and actionable. Use clear, professional language ."""
+
+# Asks for the description, result summary and step transition in one response
+STRUCTURED_SUFFIX = """
+
+Respond with a JSON object with these fields:
+- "description": the analysis above, as markdown text
+- "result": a one-sentence summary of the result or outcome of this step, focusing on the concrete change or achievement, not the process
+- "transition": {transition}"""
+
+DEFAULT_CACHE_PATH = str(Path.home() / ".cache" / "screendoc" / "responses.sqlite3")
 
 class PDF(FPDF):
     def __init__(self):
@@ -78,108 +111,213 @@ class PDF(FPDF):
             self.ln(img_height + 10)
 
 class DocumentationGenerator:
-    def __init__(self):
-        """Initialize the documentation generator."""
+    def __init__(self, max_concurrency: Optional[int] = None, requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None,
+                 cache_path: Optional[str] = DEFAULT_CACHE_PATH, cache_size: int = 64 * 1024 * 1024,
+                 structured: bool = False, max_image_edge: Optional[int] = 1600,
+                 image_format: Optional[str] = "jpeg", image_quality: int = 85,
+                 crop_to_changes: bool = False, backend: Optional[DescriptionBackend] = None):
+        """Initialize the documentation generator.
+        
+        Requests are spread over a thread pool and throttled by a shared limiter
+        to the API quota. Limits not given are read from the GEMINI_CONCURRENCY,
+        GEMINI_RPM and GEMINI_TPM environment variables.
+        
+        Args:
+            max_concurrency (Optional[int]): Most requests in flight at once (default 4)
+            requests_per_minute (Optional[float]): Request quota (default 15)
+            tokens_per_minute (Optional[float]): Input token quota (default 1,000,000)
+            cache_path (Optional[str]): SQLite file caching model responses by
+                request content, so unchanged steps are never sent twice. None
+                disables the cache, as do backends that are not ``cacheable``.
+            cache_size (int): Bytes of responses to keep before evicting the
+                least recently used
+            structured (bool): Ask for each step's description, result summary
+                and transition from the previous step in one JSON response,
+                instead of three separate requests
+            max_image_edge (Optional[int]): Scale screenshots down to at most
+                this many pixels on their longest edge before uploading; None
+                keeps their resolution
+            image_format (Optional[str]): Re-encode uploaded screenshots as
+                "jpeg", "webp" or "png"; None uploads the files unchanged
+            image_quality (int): JPEG/WebP quality of uploaded screenshots
+            crop_to_changes (bool): Upload only the part of the screen around
+                a step's changed regions when it is known and small enough
+            backend (Optional[DescriptionBackend]): Model to request
+                descriptions from; defaults to the one named by the
+                SCREENDOC_BACKEND environment variable ("gemini" or "stub")
+        """
         load_dotenv()
         
-        # Configure Gemini API
-        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-        self.model = genai.GenerativeModel(os.getenv("MODEL_NAME", "gemini-vision-1.5"))
+        self.model = backend or create_backend()
+        self.model_name = self.model.model_name
+        # Offline backends (e.g. the stub) opt out, so load tests don't just measure cache hits
+        self.cache = ResponseCache(cache_path, cache_size) if cache_path and self.model.cacheable else None
         
         # Rate limiting parameters
-        self.request_delay = 2.0  # Delay between requests in seconds
+        self.max_concurrency = max_concurrency or int(os.getenv("GEMINI_CONCURRENCY", "4"))
+        self.limiter = RequestLimiter(
+            requests_per_minute or float(os.getenv("GEMINI_RPM", "15")),
+            tokens_per_minute or float(os.getenv("GEMINI_TPM", "1000000"))
+        )
         self.max_retries = 3
+        self.max_rate_limit_retries = 8
+        self.structured = structured
+        # Requests in flight touch up to two screenshots each
+        self.images = ImagePreparer(max_image_edge, image_format, image_quality,
+                                    cache_size=2 * self.max_concurrency)
+        self.crop_to_changes = crop_to_changes
+
+    def _generate(self, contents: Union[str, list], image_bytes: Sequence[bytes] = (),
+                  json_response: bool = False) -> str:
+        """Send a request to the model within the rate limits.
+        
+        Responses are looked up in and added to the response cache first.
+        Rate-limit (429) responses pause all requests for a jittered,
+        exponentially growing delay; other errors are retried with backoff.
         
-    def generate_step_description(self, screenshot_path: str, prev_screenshot: str = None) -> str:
+        Args:
+            contents (Union[str, list]): Prompt, or list of prompt and images
+            image_bytes (Sequence[bytes]): Encoded form of the images in
+                ``contents``, in order, identifying them in the cache
+            json_response (bool): Ask the model to answer with JSON
+            
+        Returns:
+            str: Text of the response
+            
+        Raises:
+            Exception: The last error once the retries are used up
+        """
+        parts = contents if isinstance(contents, list) else [contents]
+        key = None
+        if self.cache is not None:
+            prompt = "\n".join(part for part in parts if isinstance(part, str))
+            key = ResponseCache.key(self.model_name, prompt, image_bytes)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+                
+
+        estimate = sum(len(part) // 4 if isinstance(part, str) else IMAGE_TOKENS for part in parts)
+        errors = 0
+        rate_limited = 0
+        while True:
+            self.limiter.acquire(estimate)
+            try:
+                response = self.model.generate_content(
+                    contents, {"response_mime_type": "application/json"} if json_response else None)
+            except Exception as e:
+                if is_rate_limit_error(e):
+                    rate_limited += 1
+                    if rate_limited > self.max_rate_limit_retries:
+                        raise
+                    self.limiter.pause(backoff_delay(rate_limited - 1, base=2.0))
+                else:
+                    errors += 1
+                    if errors >= self.max_retries:
+                        raise
+                    time.sleep(backoff_delay(errors - 1))
+                continue
+                
+            # Charge the quota for what the request actually used
+            usage = getattr(response, "usage_metadata", None)
+            prompt_tokens = getattr(usage, "prompt_token_count", None)
+            if prompt_tokens:
+                self.limiter.record_tokens(prompt_tokens - estimate)
+            text = response.text.strip()
+            if key is not None:
+                self.cache.put(key, text)
+            return text
+        
+    def generate_step_description(self, screenshot_path: str, prev_screenshot: str = None,
+                                  change_regions: Optional[list] = None) -> str:
         """Generate a description for a step using the Gemini Vision API.
         
         Args:
             screenshot_path (str): Path to the screenshot
             prev_screenshot (str): Path to previous screenshot for context
+            change_regions (Optional[list]): The step's ``change_regions``, used
+                to crop both screenshots when ``crop_to_changes`` is set
             
         Returns:
             str: Generated description
         """
         try:
-            # Load current screenshot
-            with open(screenshot_path, 'rb') as img_file:
-                try:
-                  current_image_data = Image.open(BytesIO(img_file.read()))
-                except Exception as e:
-                    print(f"Error opening image: {e}")
-            # Load previous screenshot if available
+            crop = change_crop(change_regions) if self.crop_to_changes and prev_screenshot else None
+            # Load current screenshot, and the previous one if available
+            current_image_data = self.images.prepare(screenshot_path, crop)
             prev_image_data = None
             if prev_screenshot and Path(prev_screenshot).exists():
-                with open(prev_screenshot, 'rb') as img_file:
-                    try:
-                      prev_image_data = Image.open(BytesIO(img_file.read()))
-                    except Exception as e:
-                      print(f"Error opening image: {e}")
+                prev_image_data = self.images.prepare(prev_screenshot, crop)
             
             # Create prompt based on context
             if prev_image_data:
-                prompt = """Analyze these two consecutive screenshots from a process documentation and:
-1. Describe what changed between the previous and current screen
-2. Explain the user's action that likely caused this change
-3. Identify any important UI elements or data that were modified
-4. Note any system responses or feedback shown
-5. Highlight any potential dependencies or prerequisites for this step
-
-Focus on being specific and actionable. Use clear, professional language.
-Previous screenshot shows the starting state, current screenshot shows the result."""
+                prompt = CHANGE_PROMPT
+                transition = ("a one-sentence transition that shows how this step follows from the "
+                              "previous one, focusing on cause-and-effect or sequential relationship")
             else:
-                prompt = """Analyze this screenshot from a process documentation and:
-1. Describe the current state of the application/screen
-2. Identify key UI elements and their purpose
-3. Note any important data or settings shown
-4. Highlight any system status or feedback messages
-5. Suggest what actions might be available or required
+                prompt = SCREEN_PROMPT
+                transition = "an empty string, as there is no previous step"
+            if self.structured:
+                prompt += STRUCTURED_SUFFIX.format(transition=transition)
 
-Focus on being specific and actionable. Use clear, professional language ."""
-
-            # Add retry logic with exponential backoff
-            max_retries = self.max_retries
-            delay = 1.0
-            
-            for attempt in range(max_retries):
-                try:
-                    if prev_image_data:
-                        response = self.model.generate_content([
-                            prompt,
-                            prev_image_data,
-                            current_image_data
-                        ])
-                    else:
-                        response = self.model.generate_content([
-                            prompt,
-                            current_image_data
-                        ])
-                    
-                    # Process and format the response
-                    description = response.text.strip()
-                    
-                    # Post-process the description
-                    description = self._enhance_description(description)
-                    
-                    time.sleep(self.request_delay)  # Rate limiting
-                    return description
-                    
-                except Exception as e:
-                    if attempt == max_retries - 1:
-                        print(f"Error generating description after {max_retries} attempts: {str(e)}")
-                        return f"Error generating description: {str(e)}"
-                    time.sleep(delay)
-                    delay *= 2  # Exponential backoff
+            if prev_image_data:
+                contents = [prompt, prev_image_data, current_image_data]
+            else:
+                contents = [prompt, current_image_data]
+            image_bytes = [part["data"] for part in contents[1:]]
+            try:
+                description = self._generate(contents, image_bytes, json_response=self.structured)
+            except Exception as e:
+                print(f"Error generating description after retries: {str(e)}")
+                return f"Error generating description: {str(e)}"
+                
+            # Post-process the description
+            if self.structured:
+                return self._structured_description(description)
+            return self._enhance_description(description)
             
         except Exception as e:
             print(f"Error processing screenshots: {str(e)}")
             return f"Error processing screenshots: {str(e)}"
             
-    def _enhance_description(self, description: str) -> str:
+    def _structured_description(self, response: str) -> str:
+        """Build a step description from a structured (JSON) response.
+        
+        Produces the same layout as the separate description, result summary
+        and context requests. Falls back to treating the response as a plain
+        description if it is not valid JSON.
+        
+        Args:
+            response (str): Model response with description, result and transition
+            
+        Returns:
+            str: Enhanced description with its context line
+        """
+        # Models sometimes wrap JSON in a markdown code fence
+        response = re.sub(r'^```(?:json)?\s*|\s*```$', '', response.strip())
+        try:
+            fields = json.loads(response)
+            if not isinstance(fields, dict):
+                raise ValueError("expected a JSON object")
+        except ValueError as e:
+            print(f"Could not parse structured response, using it as text: {e}")
+            return self._enhance_description(response)
+            
+        description = self._enhance_description(str(fields.get("description", "")).strip(),
+                                                str(fields.get("result") or "").strip() or None)
+        transition = str(fields.get("transition") or "").strip()
+        if transition:
+            description = f"*Context: {transition}*\n\n{description}"
+        return description
+
+    def _enhance_description(self, description: str, result_summary: Optional[str] = None) -> str:
         """Enhance the generated description with additional context and formatting.
         
         Args:
             description (str): Raw generated description
+            result_summary (Optional[str]): Summary of the step's result, if
+                already known; otherwise it is requested from the model
             
         Returns:
             str: Enhanced description
@@ -213,7 +351,9 @@ Focus on being specific and actionable. Use clear, professional language ."""
         # Add context markers if they don't exist
         if not any(marker in enhanced_description.lower() 
                   for marker in ['result:', 'outcome:', 'effect:', 'change:']):
-            enhanced_description += "\n\n**Result:** " + self._generate_result_summary(enhanced_description)
+            if result_summary is None:
+                result_summary = self._generate_result_summary(enhanced_description)
+            enhanced_description += "\n\n**Result:** " + result_summary
             
         return enhanced_description
         
@@ -233,8 +373,7 @@ Focus on being specific and actionable. Use clear, professional language ."""
 
 Focus on the concrete change or achievement, not the process."""
 
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
+            return self._generate(prompt)
         except Exception as e:
             print(f"Error generating result summary: {str(e)}")
             return "Step completed successfully."
@@ -248,15 +387,16 @@ Focus on the concrete change or achievement, not the process."""
         Returns:
             List[Step]: Steps with added context links
         """
-        for i, step in enumerate(steps):
-            if not hasattr(step, 'description') or not step.description:
-                continue
-                
-            # Add context from previous step if available
-            if i > 0 and hasattr(steps[i-1], 'description') and steps[i-1].description:
-                context = self._generate_step_context(steps[i-1].description, step.description)
-                if context:
-                    step.description = f"{context}\n\n{step.description}"
+        # Link each step to the previous one's description as generated, so all
+        # links can be requested at once
+        linked = [i for i in range(1, len(steps)) if steps[i].description and steps[i-1].description]
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            contexts = list(pool.map(
+                lambda i: self._generate_step_context(steps[i-1].description, steps[i].description), linked))
+            
+        for i, context in zip(linked, contexts):
+            if context:
+                steps[i].description = f"{context}\n\n{steps[i].description}"
                     
         return steps
         
@@ -281,26 +421,48 @@ Current Step:
 
 Focus on cause-and-effect or sequential relationship. Be concise and professional."""
 
-            response = self.model.generate_content(prompt)
-            return f"*Context: {response.text.strip()}*"
+            return f"*Context: {self._generate(prompt)}*"
         except Exception as e:
             print(f"Error generating step context: {str(e)}")
             return ""
             
     def generate_documentation(self, steps: List[Step], screenshot_paths: Dict[int, str], 
-                             output_format: str = "pdf", template: str = "default") -> str:
-        """Generate documentation from detected steps."""
-        # Generate descriptions for steps
-        for i, step in enumerate(steps):
-            if i in screenshot_paths:
-                prev_screenshot = screenshot_paths.get(i-1) if i > 0 else None
-                step.description = self.generate_step_description(
-                    screenshot_paths[i],
-                    prev_screenshot
-                )
-        
-        # Add contextual links between steps
-        steps = self._link_steps(steps)
+                             output_format: str = "pdf", template: str = "default",
+                             describe: bool = True) -> str:
+        """Generate documentation from detected steps.
+        
+        Args:
+            steps (List[Step]): Steps to document
+            screenshot_paths (Dict[int, str]): Screenshot path of each step by index
+            output_format (str): "pdf", "html" or "markdown"
+            template (str): Documentation template
+            describe (bool): Generate step descriptions. Pass False if the steps
+                were already described, e.g. while detection was running.
+            
+        Returns:
+            str: Path of the generated document
+        """
+        # Generate descriptions for steps, several requests at a time
+        if describe:
+            described = [i for i in range(len(steps)) if i in screenshot_paths]
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+                descriptions = pool.map(
+                    lambda i: self.generate_step_description(
+                        screenshot_paths[i],
+                        screenshot_paths.get(i-1) if i > 0 else None,
+                        steps[i].change_regions
+                    ),
+                    described)
+                for i, description in zip(described, descriptions):
+                    steps[i].description = description
+        
+        # Add contextual links between steps; structured descriptions have them
+        if not self.structured:
+            steps = self._link_steps(steps)
+        
+        print(f"Screenshot uploads: {self.images}")
+        if self.cache is not None:
+            print(f"Response cache: {self.cache}")
         
         # Generate documentation in requested format
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
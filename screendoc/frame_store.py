@@ -0,0 +1,117 @@
+import os
+import shutil
+import cv2
+import numpy as np
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+
+class FrameRef(ABC):
+    """Reference to a frame whose pixels are loaded only when needed."""
+
+    __slots__ = ()
+
+    @abstractmethod
+    def load(self) -> np.ndarray:
+        """Load the frame.
+
+        Returns:
+            np.ndarray: Frame in BGR format
+        """
+
+    def discard(self) -> None:
+        """Release any storage held for the frame."""
+
+
+class VideoFrameRef(FrameRef):
+    """A frame identified by its index in a video file."""
+
+    __slots__ = ("video_path", "frame_index")
+
+    def __init__(self, video_path: str, frame_index: int):
+        self.video_path = video_path
+        self.frame_index = frame_index
+
+    def load(self) -> np.ndarray:
+        cap = cv2.VideoCapture(self.video_path)
+        try:
+            if self.frame_index:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, self.frame_index)
+            ret, frame = cap.read()
+        finally:
+            cap.release()
+        if not ret:
+            raise RuntimeError(f"Could not read frame {self.frame_index} of {self.video_path}")
+        return frame
+
+    def __repr__(self) -> str:
+        return f"VideoFrameRef({self.video_path!r}, {self.frame_index})"
+
+
+class FileFrameRef(FrameRef):
+    """A frame stored in its own file.
+
+    ``.npy`` files are memory-mapped, anything else is decoded with OpenCV.
+    """
+
+    __slots__ = ("path",)
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> np.ndarray:
+        if self.path.endswith(".npy"):
+            return np.load(self.path, mmap_mode="r")
+        frame = cv2.imread(self.path)
+        if frame is None:
+            raise RuntimeError(f"Could not read frame from {self.path}")
+        return frame
+
+    def discard(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __repr__(self) -> str:
+        return f"FileFrameRef({self.path!r})"
+
+
+class FrameSpool:
+    """Directory that frames are spilled to as PNG files.
+
+    Used for frames that must outlive the capture buffer before the video
+    they belong to can be read back, e.g. steps detected during recording.
+    PNG keeps the frames lossless at a fraction of their raw size; the
+    spool is meant to be removed with ``cleanup`` once the frames can be
+    read from the video instead.
+    """
+
+    def __init__(self, directory: str):
+        """Create the spool directory.
+
+        Args:
+            directory (str): Directory to store frames in
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def store(self, frame: np.ndarray, frame_index: int) -> FileFrameRef:
+        """Write a frame to the spool.
+
+        Args:
+            frame (np.ndarray): Frame in BGR format
+            frame_index (int): Index of the frame in its video, used to name the file
+
+        Returns:
+            FileFrameRef: Reference to the stored frame
+        """
+        path = str(self.directory / f"frame_{frame_index:08d}.png")
+        # Low compression: fast enough for the detector thread, still far below raw size
+        if not cv2.imwrite(path, frame, [cv2.IMWRITE_PNG_COMPRESSION, 1]):
+            raise RuntimeError(f"Could not write frame to {path}")
+        return FileFrameRef(path)
+
+    def cleanup(self) -> None:
+        """Delete the spool directory and every frame in it."""
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,94 @@
+import cv2
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def dhash(image: np.ndarray, hash_size: int = 8) -> int:
+    """Compute the difference hash of an image.
+
+    The image is reduced to a ``hash_size + 1`` by ``hash_size`` grayscale
+    grid; each bit records whether a cell is brighter than its right-hand
+    neighbour. Visually similar images get hashes a small Hamming distance
+    apart.
+
+    Args:
+        image (np.ndarray): Image in BGR or grayscale format
+        hash_size (int): Bits per row and number of rows of the hash
+
+    Returns:
+        int: Hash with ``hash_size * hash_size`` bits
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming_distance(hash1: int, hash2: int) -> int:
+    """Count the bits that differ between two hashes."""
+    return (hash1 ^ hash2).bit_count()
+
+
+class BKTree:
+    """Burkhard-Keller tree over integer hashes under Hamming distance.
+
+    Supports finding every stored hash within a given distance of a query
+    without comparing against all of them: by the triangle inequality only
+    children whose edge distance lies within the search radius of the
+    query's distance to a node can contain matches.
+    """
+
+    def __init__(self):
+        self._root: Optional[Tuple[int, List[Any], Dict[int, tuple]]] = None
+        self.size = 0
+
+    def add(self, hash_value: int, item: Any) -> None:
+        """Store an item under its hash.
+
+        Args:
+            hash_value (int): Hash of the item
+            item (Any): Value returned by ``search``
+        """
+        self.size += 1
+        if self._root is None:
+            self._root = (hash_value, [item], {})
+            return
+        node = self._root
+        while True:
+            distance = hamming_distance(hash_value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (hash_value, [item], {})
+                return
+            node = child
+
+    def search(self, hash_value: int, max_distance: int) -> List[Tuple[int, Any]]:
+        """Find the items whose hash is within a Hamming distance of a query.
+
+        Args:
+            hash_value (int): Query hash
+            max_distance (int): Largest distance to accept
+
+        Returns:
+            List[Tuple[int, Any]]: (distance, item) pairs, closest first
+        """
+        matches = []
+        if self._root is None:
+            return matches
+        pending = [self._root]
+        while pending:
+            node_hash, items, children = pending.pop()
+            distance = hamming_distance(hash_value, node_hash)
+            if distance <= max_distance:
+                matches.extend((distance, item) for item in items)
+            for edge, child in children.items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    pending.append(child)
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+    def __len__(self) -> int:
+        return self.size
@@ -0,0 +1,136 @@
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import Optional, Sequence, Tuple
+from PIL import Image
+
+MIME_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp", "png": "image/png"}
+
+
+def change_crop(regions: Sequence[Tuple[float, float, float, float]], padding: float = 0.05,
+                min_size: float = 0.3, max_area: float = 0.6) -> Optional[Tuple[float, float, float, float]]:
+    """Pick the part of a screenshot to keep around its changed regions.
+
+    Args:
+        regions (Sequence[Tuple[float, float, float, float]]): Changed regions
+            (x, y, width, height) as fractions of the image size, as in
+            ``Step.change_regions``
+        padding (float): Margin added on each side, as a fraction of the image
+        min_size (float): Smallest crop width and height, so some context remains
+        max_area (float): Largest crop area worth cropping to
+
+    Returns:
+        Optional[Tuple[float, float, float, float]]: Crop box (left, top, right,
+            bottom) as fractions of the image size, or None to keep the whole image
+    """
+    if not regions:
+        return None
+    left = min(x for x, _, _, _ in regions) - padding
+    top = min(y for _, y, _, _ in regions) - padding
+    right = max(x + w for x, _, w, _ in regions) + padding
+    bottom = max(y + h for _, y, _, h in regions) + padding
+    box = []
+    for low, high in ((left, right), (top, bottom)):
+        if high - low < min_size:
+            middle = (low + high) / 2
+            low, high = middle - min_size / 2, middle + min_size / 2
+        # Shift back inside the image rather than shrinking
+        shift = max(0.0, -low) - max(0.0, high - 1.0)
+        box.append((max(0.0, low + shift), min(1.0, high + shift)))
+    (left, right), (top, bottom) = box
+    if (right - left) * (bottom - top) > max_area:
+        return None
+    return left, top, right, bottom
+
+
+class ImagePreparer:
+    """Shrinks and re-encodes screenshots before they are sent to the model.
+
+    Decoded screenshots are kept in a small LRU cache, so the previous step's
+    screenshot, which was the current one in the request before, is not
+    decoded again.
+    """
+
+    def __init__(self, max_edge: Optional[int] = 1600, image_format: Optional[str] = "jpeg",
+                 quality: int = 85, cache_size: int = 4):
+        """Initialize the preparer.
+
+        Args:
+            max_edge (Optional[int]): Longest edge in pixels of uploaded images;
+                None keeps the resolution
+            image_format (Optional[str]): "jpeg", "webp" or "png" to re-encode
+                to, or None to upload the files unchanged
+            quality (int): JPEG/WebP quality (1-100)
+            cache_size (int): Number of decoded screenshots to keep
+        """
+        if image_format is not None and image_format not in MIME_TYPES:
+            raise ValueError(f"Unsupported image format: {image_format}")
+        self.max_edge = max_edge
+        self.image_format = image_format
+        self.quality = quality
+        self.cache_size = cache_size
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._decoded = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _decode(self, path: str) -> Image.Image:
+        stat = os.stat(path)
+        key = (path, stat.st_mtime, stat.st_size)
+        with self._lock:
+            image = self._decoded.get(key)
+            if image is not None:
+                self._decoded.move_to_end(key)
+                return image
+        with Image.open(path) as source:
+            image = source.convert("RGB")
+        with self._lock:
+            self._decoded[key] = image
+            while len(self._decoded) > self.cache_size:
+                self._decoded.popitem(last=False)
+        return image
+
+    def prepare(self, path: str, crop: Optional[Tuple[float, float, float, float]] = None) -> dict:
+        """Prepare a screenshot for upload.
+
+        Args:
+            path (str): Path to the screenshot
+            crop (Optional[Tuple[float, float, float, float]]): Part to keep as
+                (left, top, right, bottom) fractions, e.g. from ``change_crop``
+
+        Returns:
+            dict: Image part with "mime_type" and encoded "data"
+        """
+        original_size = os.path.getsize(path)
+        if self.image_format is None and crop is None:
+            with open(path, "rb") as f:
+                data = f.read()
+            extension = os.path.splitext(path)[1].lower().lstrip(".")
+            mime_type = MIME_TYPES.get("jpeg" if extension == "jpg" else extension, "image/png")
+        else:
+            image = self._decode(path)
+            if crop is not None:
+                width, height = image.size
+                left, top, right, bottom = crop
+                image = image.crop((int(left * width), int(top * height),
+                                    int(round(right * width)), int(round(bottom * height))))
+            if self.max_edge and max(image.size) > self.max_edge:
+                image = image.copy()
+                image.thumbnail((self.max_edge, self.max_edge), Image.LANCZOS)
+            image_format = self.image_format or "png"
+            buffer = BytesIO()
+            if image_format == "png":
+                image.save(buffer, format="PNG")
+            else:
+                image.save(buffer, format=image_format.upper(), quality=self.quality)
+            data = buffer.getvalue()
+            mime_type = MIME_TYPES[image_format]
+        with self._lock:
+            self.bytes_in += original_size
+            self.bytes_out += len(data)
+        return {"mime_type": mime_type, "data": data}
+
+    def __str__(self) -> str:
+        ratio = self.bytes_out / self.bytes_in if self.bytes_in else 0.0
+        return f"{self.bytes_out / 1024:.0f} KiB uploaded for {self.bytes_in / 1024:.0f} KiB of screenshots ({ratio:.0%})"
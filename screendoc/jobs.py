@@ -0,0 +1,133 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Optional
+from .frame_store import VideoFrameRef
+from .similarity_signal import SimilaritySignal
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(max_workers: int = 2) -> ThreadPoolExecutor:
+    """Get the shared worker pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="screendoc-job")
+        return _pool
+
+
+class Job:
+    """Handle to a task running on the shared background worker pool.
+
+    The task receives the job as its first argument and may report progress
+    through ``update``. Callers poll ``progress`` and ``done`` and collect the
+    return value with ``result``.
+    """
+
+    def __init__(self, fn: Callable[..., Any], *args, **kwargs):
+        """Submit a task to the worker pool.
+
+        Args:
+            fn (Callable[..., Any]): Task to run, called as ``fn(job, *args, **kwargs)``
+        """
+        self.progress = 0.0
+        self.status = "queued"
+        self._future = _get_pool().submit(self._run, fn, args, kwargs)
+
+    def _run(self, fn: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+        self.status = "running"
+        try:
+            result = fn(self, *args, **kwargs)
+        except Exception:
+            self.status = "failed"
+            raise
+        self.progress = 1.0
+        self.status = "done"
+        return result
+
+    def update(self, progress: float) -> None:
+        """Report task progress.
+
+        Args:
+            progress (float): Fraction of the work completed (0-1)
+        """
+        self.progress = max(0.0, min(1.0, progress))
+
+    def done(self) -> bool:
+        """Check whether the task has finished, successfully or not."""
+        return self._future.done()
+
+    def result(self, timeout: Optional[float] = None) -> Any:
+        """Wait for the task and return its result.
+
+        Args:
+            timeout (Optional[float]): Seconds to wait, or None to wait indefinitely
+
+        Returns:
+            Any: Value returned by the task
+
+        Raises:
+            Exception: Whatever the task raised
+        """
+        return self._future.result(timeout)
+
+    @property
+    def error(self) -> Optional[BaseException]:
+        """Optional[BaseException]: Exception raised by a finished task, if any."""
+        if not self._future.done():
+            return None
+        return self._future.exception()
+
+
+class FinalizeJob(Job):
+    """Background job turning a stopped recording into its final video.
+
+    While the web-compatible copy is being transcoded, ``raw_path`` and
+    ``raw_timestamps`` point at the recorded file so step detection can
+    start on it right away. The raw file is kept after the job finishes
+    until ``release_raw`` is called. ``raw_path`` is None when there is no
+    transcode to wait for, or no single raw file (e.g. segments still to be
+    joined).
+    """
+
+    def __init__(self, fn: Callable[..., Any], *args, raw_path: Optional[str] = None,
+                 raw_timestamps=None, **kwargs):
+        """Submit a finalisation task to the worker pool.
+
+        Args:
+            fn (Callable[..., Any]): Finalisation task returning (video path, timestamps)
+            raw_path (Optional[str]): Recorded file readable before the job finishes
+            raw_timestamps: Frame timestamps of the raw file
+        """
+        self.raw_path = raw_path
+        self.raw_timestamps = raw_timestamps
+        super().__init__(fn, *args, **kwargs)
+
+    def release_raw(self, steps: Iterable = ()) -> None:
+        """Move steps detected on the raw file to the final video and delete the raw file.
+
+        Call once the job has finished. The final video is transcoded frame
+        for frame, so frame indices carry over. Does nothing if the job failed,
+        leaving the raw file in place.
+
+        Args:
+            steps (Iterable): Steps whose frame references may point at the raw file
+        """
+        if self.raw_path is None or not self.done() or self.error is not None:
+            return
+        final_path = self.result()[0]
+        if not final_path or final_path == self.raw_path:
+            return
+        for step in steps:
+            ref = getattr(step, "frame_ref", None)
+            if isinstance(ref, VideoFrameRef) and ref.video_path == self.raw_path:
+                ref.video_path = final_path
+        # A signal cached from the raw file doesn't describe the transcoded frames
+        SimilaritySignal.remove(self.raw_path)
+        try:
+            os.remove(self.raw_path)
+        except OSError as e:
+            print(f"Could not remove {self.raw_path}: {e}")
+        self.raw_path = None
@@ -0,0 +1,91 @@
+import time
+import threading
+
+
+def quality_to_crf(quality: int) -> int:
+    """Map a 1-100 quality setting to an x264 CRF value.
+
+    Quality 80 maps to CRF 23, the x264 default; 100 maps to 16 and 1 to 51.
+
+    Args:
+        quality (int): Quality setting (1-100, higher is better)
+
+    Returns:
+        int: x264 CRF value (lower is better)
+    """
+    quality = max(1, min(100, quality))
+    return max(0, min(51, int(round(51 - quality * 0.35))))
+
+
+class RateController:
+    """Adapts the capture frame rate to what the machine can sustain.
+
+    The capture and encoder threads report how long each grab and each
+    encode takes. The slower of the two stages sets the frame time the
+    pipeline can keep up with; the controller lowers the frame rate when that
+    exceeds the current frame budget and raises it back towards the target
+    when there is headroom again.
+    """
+
+    def __init__(self, target_fps: float, min_fps: float = 5.0, headroom: float = 0.7,
+                 smoothing: float = 0.1, adjust_interval: float = 1.0):
+        """Initialize the rate controller.
+
+        Args:
+            target_fps (float): Frame rate to aim for
+            min_fps (float): Lowest frame rate the controller may choose
+            headroom (float): Fraction of the frame budget the slowest stage may
+                use before the rate is raised again
+            smoothing (float): Weight of new samples in the latency averages
+            adjust_interval (float): Minimum seconds between rate changes
+        """
+        self.target_fps = target_fps
+        self.min_fps = min(min_fps, target_fps)
+        self.fps = target_fps
+        self.headroom = headroom
+        self.smoothing = smoothing
+        self.adjust_interval = adjust_interval
+        self.grab_latency = 0.0
+        self.encode_latency = 0.0
+        self._last_adjust = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def _average(self, current: float, sample: float) -> float:
+        if current == 0.0:
+            return sample
+        return current + self.smoothing * (sample - current)
+
+    def record_grab(self, seconds: float) -> None:
+        """Report the duration of one screen grab."""
+        with self._lock:
+            self.grab_latency = self._average(self.grab_latency, seconds)
+
+    def record_encode(self, seconds: float) -> None:
+        """Report the duration of converting and writing one frame."""
+        with self._lock:
+            self.encode_latency = self._average(self.encode_latency, seconds)
+
+    def update(self) -> float:
+        """Adjust the frame rate from the measured latencies.
+
+        Returns:
+            float: Frame rate to capture at from now on
+        """
+        now = time.perf_counter()
+        if now - self._last_adjust < self.adjust_interval:
+            return self.fps
+        with self._lock:
+            frame_time = max(self.grab_latency, self.encode_latency)
+        if frame_time <= 0:
+            return self.fps
+
+        budget = 1.0 / self.fps
+        if frame_time > budget:
+            # Falling behind: drop to a rate the slowest stage can sustain
+            self.fps = max(self.min_fps, min(self.fps * 0.8, self.headroom / frame_time))
+            self._last_adjust = now
+        elif frame_time < budget * self.headroom and self.fps < self.target_fps:
+            # Spare capacity: step back up towards the target
+            self.fps = min(self.target_fps, self.fps * 1.25, self.headroom / frame_time)
+            self._last_adjust = now
+        return self.fps
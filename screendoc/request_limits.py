@@ -0,0 +1,118 @@
+import random
+import time
+import threading
+from typing import Optional
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at a fixed rate per minute.
+
+    Reservations may take the bucket below zero; the caller then waits for
+    the debt to be refilled, so large requests are delayed rather than
+    rejected and waiting callers are served in order.
+    """
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        """Initialize a full bucket.
+
+        Args:
+            per_minute (float): Tokens added per minute
+            capacity (Optional[float]): Most tokens the bucket holds, i.e. the
+                largest burst; defaults to one minute's worth
+        """
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Take tokens from the bucket.
+
+        Args:
+            amount (float): Tokens to take
+
+        Returns:
+            float: Seconds to wait before the tokens may be used
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+
+class RequestLimiter:
+    """Shared limit on API requests and tokens per minute.
+
+    Every thread calling the API acquires from the same limiter before each
+    request. A rate-limit response pauses all of them.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: Optional[float] = None):
+        """Initialize the limiter.
+
+        Args:
+            requests_per_minute (float): Request quota
+            tokens_per_minute (Optional[float]): Token quota, or None if unlimited
+        """
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 0) -> None:
+        """Block until a request using about ``tokens`` tokens may be sent.
+
+        Args:
+            tokens (float): Estimated tokens of the request
+        """
+        wait = self.requests.reserve(1)
+        if self.tokens is not None and tokens:
+            wait = max(wait, self.tokens.reserve(tokens))
+        with self._lock:
+            wait = max(wait, self._paused_until - time.monotonic())
+        if wait > 0:
+            time.sleep(wait)
+
+    def record_tokens(self, tokens: float) -> None:
+        """Charge tokens used beyond the estimate passed to ``acquire``.
+
+        Args:
+            tokens (float): Additional tokens (negative to refund)
+        """
+        if self.tokens is not None and tokens:
+            self.tokens.reserve(tokens)
+
+    def pause(self, seconds: float) -> None:
+        """Hold back all requests for a while, e.g. after a rate-limit error.
+
+        Args:
+            seconds (float): Seconds from now before requests may resume
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """Exponential backoff with full jitter.
+
+    Args:
+        attempt (int): Number of the failed attempt, starting at 0
+        base (float): Delay ceiling of the first retry in seconds
+        cap (float): Largest delay ceiling in seconds
+
+    Returns:
+        float: Seconds to wait, random between 0 and the ceiling
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Check whether an API error means the quota was exceeded (HTTP 429)."""
+    code = getattr(error, "code", None)
+    if code == 429 or getattr(code, "value", None) == 429:
+        return True
+    message = str(error)
+    return "429" in message or "RESOURCE_EXHAUSTED" in message or "quota" in message.lower()
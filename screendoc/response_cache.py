@@ -0,0 +1,106 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Optional
+
+
+class ResponseCache:
+    """Persistent cache of model responses, keyed by the content of the request.
+
+    Entries live in a SQLite database. Once the stored responses exceed
+    ``max_bytes``, the least recently used ones are evicted. Safe to share
+    between threads.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024):
+        """Open or create the cache database.
+
+        Args:
+            path (str): Path of the SQLite database file
+            max_bytes (int): Total size of stored responses to keep
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            last_used REAL NOT NULL)""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._db.commit()
+        self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def key(model_name: str, prompt: str, images: Iterable[bytes] = ()) -> str:
+        """Build the cache key of a request.
+
+        Args:
+            model_name (str): Name of the model the request goes to
+            prompt (str): Prompt text
+            images (Iterable[bytes]): Encoded images sent with the prompt, in order
+
+        Returns:
+            str: Hex digest identifying the request
+        """
+        digest = hashlib.sha256()
+        for part in [model_name.encode(), prompt.encode(), *images]:
+            # Length-prefix each part so different splits never collide
+            digest.update(len(part).to_bytes(8, "big"))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Look up a response and mark it as recently used.
+
+        Args:
+            key (str): Key from ``key``
+
+        Returns:
+            Optional[str]: The cached response, or None
+        """
+        with self._lock:
+            row = self._db.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        """Store a response, evicting the least recently used ones if needed.
+
+        Args:
+            key (str): Key from ``key``
+            value (str): Response text
+        """
+        size = len(value.encode())
+        with self._lock:
+            old = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute("INSERT OR REPLACE INTO responses (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                             (key, value, size, time.time()))
+            self._size += size - (old[0] if old else 0)
+            while self._size > self.max_bytes:
+                oldest = self._db.execute(
+                    "SELECT key, size FROM responses ORDER BY last_used LIMIT 64").fetchall()
+                for old_key, old_size in oldest:
+                    if self._size <= self.max_bytes:
+                        break
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                    self._size -= old_size
+            self._db.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def __str__(self) -> str:
+        return f"{self.hits} hits, {self.misses} misses, {self._size / 1024:.0f} KiB stored"
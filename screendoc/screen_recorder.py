@@ -3,106 +3,1010 @@ import time
 import numpy as np
 import mss
 import os
+import shutil
+import subprocess
+import json
 import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
 from pathlib import Path
-from typing import Tuple
+from typing import Callable, List, Optional, Tuple
+from .step_detector import Step, StepDetector
+from .timestamp_index import (TimestampIndex, TimestampIndexWriter, move_sidecar, probe_timestamps,
+                              sidecar_path)
+from .jobs import FinalizeJob
+from .frame_store import FileFrameRef, FrameSpool, VideoFrameRef
+from .rate_control import RateController, quality_to_crf
+
+
+@dataclass
+class RecordingStats:
+    """Counters describing how well a recording kept up with its target rate."""
+    frames_captured: int = 0
+    frames_written: int = 0
+    dropped_frames: int = 0
+    late_frames: int = 0
+    unchanged_frames: int = 0
+    detection_dropped_frames: int = 0
+    effective_fps: float = 0.0
+
+    def __str__(self) -> str:
+        return (f"{self.frames_written}/{self.frames_captured} frames written "
+                f"at {self.effective_fps:.1f} fps, "
+                f"{self.dropped_frames} dropped, {self.late_frames} late, "
+                f"{self.unchanged_frames} unchanged skipped, "
+                f"{self.detection_dropped_frames} not checked for steps")
+
+
+class FrameRingBuffer:
+    """Bounded buffer handing captured frames from the capture thread to the encoder thread.
+
+    The buffer is bounded both by frame count and by the bytes of the frames
+    it holds, so large (e.g. 4K) frames cannot pile up to gigabytes. When it
+    is full the oldest frame is discarded, so the capture thread never blocks
+    on a slow encoder.
+    """
+
+    def __init__(self, capacity: int = 64, max_bytes: Optional[int] = None):
+        """Initialize the ring buffer.
+        
+        Args:
+            capacity (int): Maximum number of frames held at once
+            max_bytes (Optional[int]): Maximum total size of the frames held at
+                once; the newest frame is always kept
+        """
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self._frames = deque()
+        self._bytes = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item, nbytes: int = 0) -> None:
+        """Add a frame, discarding the oldest ones if the buffer is full.
+        
+        Args:
+            item: Frame, or tuple holding a frame
+            nbytes (int): Size of the frame, counted against ``max_bytes``
+        """
+        with self._cond:
+            self._frames.append((item, nbytes))
+            self._bytes += nbytes
+            while len(self._frames) > 1 and (
+                    len(self._frames) > self.capacity
+                    or (self.max_bytes is not None and self._bytes > self.max_bytes)):
+                _, dropped_bytes = self._frames.popleft()
+                self._bytes -= dropped_bytes
+                self.dropped += 1
+            self._cond.notify()
+
+    def get(self):
+        """Take the oldest frame, waiting until one is available.
+        
+        Returns:
+            The oldest buffered item, or None once the buffer is closed and drained
+        """
+        with self._cond:
+            while not self._frames and not self._closed:
+                self._cond.wait()
+            if self._frames:
+                item, nbytes = self._frames.popleft()
+                self._bytes -= nbytes
+                return item
+            return None
+
+    def close(self) -> None:
+        """Signal that no more frames will be added."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class FFmpegPipeWriter:
+    """Video writer that streams raw BGR frames into an ffmpeg H.264 encoder.
+
+    Mirrors the ``write``/``release`` interface of ``cv2.VideoWriter`` so the
+    encoder thread can use either. The output is a web-compatible MP4 as soon
+    as the writer is released, with no second transcode pass.
+    """
+
+    def __init__(self, output_file: str, fps: float, frame_size: Tuple[int, int],
+                 crf: int = 23, preset: str = "veryfast", vfr: bool = False):
+        """Start the ffmpeg encoder process.
+        
+        Args:
+            output_file (str): Path of the MP4 file to write
+            fps (float): Frame rate of the input frames
+            frame_size (Tuple[int, int]): Frame width and height in pixels
+            crf (int): x264 quality level (lower is better, 23 is default)
+            preset (str): x264 speed preset, fast enough to keep up in real time
+            vfr (bool): Stamp each frame with the time it reaches ffmpeg and keep
+                those timestamps in the output, for frames written at irregular
+                intervals (keyframes only, or at an adaptive rate); ``fps`` is
+                then ignored
+        """
+        width, height = frame_size
+        self.output_file = output_file
+        self.frames_written = 0
+        # A millisecond time base, so wall-clock stamps are not rounded onto a frame-rate grid
+        timing = (['-use_wallclock_as_timestamps', '1', '-framerate', '1000'] if vfr
+                  else ['-r', str(fps)])
+        self._proc = subprocess.Popen([
+            'ffmpeg', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24',
+            '-s', f'{width}x{height}', *timing,
+            '-i', '-',
+            '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',  # yuv420p needs even dimensions
+            '-c:v', 'libx264',
+            '-preset', preset,
+            '-crf', str(crf),
+            '-pix_fmt', 'yuv420p',  # Widest player compatibility
+            # Keep the input timestamps; a shared timescale lets segments be joined by stream copy
+            *(['-fps_mode', 'passthrough', '-video_track_timescale', '1000'] if vfr else []),
+            '-movflags', '+faststart',  # Enable fast start for web playback
+            '-y', output_file
+        ], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    @staticmethod
+    def available() -> bool:
+        """Check whether an ffmpeg binary is on the PATH."""
+        return shutil.which('ffmpeg') is not None
+
+    def write(self, frame: np.ndarray) -> None:
+        """Send one BGR frame to the encoder.
+        
+        Raises:
+            BrokenPipeError: If the ffmpeg process has exited
+        """
+        self._proc.stdin.write(np.ascontiguousarray(frame).data)
+        self.frames_written += 1
+
+    def release(self) -> None:
+        """Flush the encoder and wait for the MP4 to be finalised.
+
+        The frames in the finished file are counted, so a frame dropped by
+        the encoder cannot leave the timestamp sidecar out of step with it.
+        
+        Raises:
+            subprocess.CalledProcessError: If ffmpeg failed
+            RuntimeError: If the file holds a different number of frames than were written
+        """
+        try:
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            pass  # ffmpeg already exited; its exit code tells why
+        stderr = self._proc.stderr.read()
+        if self._proc.wait() != 0:
+            raise subprocess.CalledProcessError(self._proc.returncode, self._proc.args, stderr=stderr)
+        if self.frames_written:
+            encoded = len(probe_timestamps(self.output_file))
+            if encoded != self.frames_written:
+                raise RuntimeError(f"{self.output_file} holds {encoded} frames, "
+                                   f"but {self.frames_written} were written")
+
+
+def _describe_error(error: Exception) -> str:
+    """Format an encoder error, including ffmpeg's own message if there is one."""
+    stderr = getattr(error, "stderr", None)
+    if stderr:
+        return f"{error}: {stderr.decode(errors='replace').strip()}"
+    return str(error)
+
+
+def transcode_to_mp4(input_file: str, output_file: str, preset: str = "medium", crf: int = 23,
+                     duration: Optional[float] = None,
+                     on_progress: Optional[Callable[[float], None]] = None) -> None:
+    """Convert a video to web-compatible H.264 MP4 using ffmpeg.
+    
+    Args:
+        input_file (str): Video to convert
+        output_file (str): Path of the MP4 file to write
+        preset (str): x264 speed preset
+        crf (int): x264 quality level (lower is better, 23 is default)
+        duration (Optional[float]): Input duration in seconds, used to turn
+            ffmpeg's progress output into a fraction
+        on_progress (Optional[Callable[[float], None]]): Called with the fraction
+            of the input converted so far
+        
+    Raises:
+        subprocess.CalledProcessError: If ffmpeg fails
+    """
+    # Ensure the conversion is done with web-compatible settings
+    cmd = [
+        'ffmpeg', '-loglevel', 'error', '-i', input_file,
+        '-c:v', 'libx264',  # Use H.264 codec
+        '-preset', preset,  # Balance between speed and quality
+        '-crf', str(crf),  # Quality level (lower is better, 23 is default)
+        '-movflags', '+faststart',  # Enable fast start for web playback
+        '-progress', 'pipe:1', '-nostats',  # Machine-readable progress on stdout
+        '-y',  # Overwrite output file if it exists
+        output_file
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    for line in proc.stdout:
+        key, _, value = line.decode(errors="replace").strip().partition("=")
+        # out_time_ms is also reported in microseconds by ffmpeg
+        if key in ("out_time_us", "out_time_ms") and duration and on_progress and value.isdigit():
+            on_progress(min(1.0, int(value) / 1e6 / duration))
+    stderr = proc.stderr.read()
+    if proc.wait() != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=stderr)
+
+
+@dataclass
+class Segment:
+    """One fixed-length piece of a segmented recording."""
+    index: int
+    path: str
+    first_frame: int
+    start_time: float
+    end_time: float = 0.0
+    frame_count: int = 0
+    fps: float = 0.0
+    effective_fps: float = 0.0
+    finalized: bool = False
+
+
+class SegmentedWriter:
+    """Video writer that rolls over to a new segment file at a fixed interval.
+
+    Finished segments are finalised (flushed, and transcoded to H.264 if they
+    were written as XVID) on a background thread while recording continues.
+    A ``segments.json`` manifest is rewritten as each segment completes, so a
+    crash loses at most the segment being written. All segments share the
+    same codec and frame size and can be joined with a stream copy; each may
+    use its own frame rate.
+    """
+
+    def __init__(self, segment_dir: str, open_segment: Callable[[str, float], Tuple[object, str]],
+                 segment_seconds: float, fps: Callable[[], float], crf: int = 23):
+        """Initialize the segmented writer.
+        
+        Args:
+            segment_dir (str): Directory to write segment files to
+            open_segment (Callable[[str, float], Tuple[object, str]]): Opens a video
+                writer for a path without extension and a frame rate, returning
+                the writer and its path
+            segment_seconds (float): Length of each segment in seconds
+            fps (Callable[[], float]): Returns the frame rate for a new segment
+            crf (int): x264 quality level for segments transcoded from XVID
+        """
+        self.segment_dir = Path(segment_dir)
+        self.segment_dir.mkdir(parents=True, exist_ok=True)
+        self.segment_seconds = segment_seconds
+        self.segments: List[Segment] = []
+        self._open_segment = open_segment
+        self._fps = fps
+        self.crf = crf
+        self._writer = None
+        self._frames = 0
+        # A single worker finalises segments in order without blocking capture
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = []
+        self._manifest_lock = threading.Lock()
+
+    def due(self, timestamp: float) -> bool:
+        """Check whether a frame captured at this time starts a new segment."""
+        return not self.segments or timestamp - self.segments[-1].start_time >= self.segment_seconds
+
+    def write(self, frame: np.ndarray, timestamp: float, roll: bool = True) -> None:
+        """Write a frame, starting a new segment when the current one is full.
+        
+        Args:
+            frame (np.ndarray): Frame in BGR format
+            timestamp (float): Capture time of the frame
+            roll (bool): Start a new segment if one is due; False appends to
+                the current segment, e.g. to end it with a held frame
+        """
+        if roll and self.due(timestamp):
+            self._roll(timestamp)
+        segment = self.segments[-1]
+        self._writer.write(frame)
+        segment.end_time = timestamp
+        segment.frame_count += 1
+        if segment.end_time > segment.start_time:
+            segment.effective_fps = (segment.frame_count - 1) / (segment.end_time - segment.start_time)
+        self._frames += 1
+
+    def _roll(self, timestamp: float) -> None:
+        """Hand the current segment to the finaliser and open the next one."""
+        self._close_current()
+        base = str(self.segment_dir / f"segment_{len(self.segments):04d}")
+        fps = self._fps()
+        self._writer, path = self._open_segment(base, fps)
+        self.segments.append(Segment(index=len(self.segments), path=path, first_frame=self._frames,
+                                     start_time=timestamp, fps=fps))
+
+    def _close_current(self) -> None:
+        if self._writer is not None:
+            self._pending.append(self._executor.submit(self._finalize, self.segments[-1], self._writer))
+            self._writer = None
+
+    def _finalize(self, segment: Segment, writer) -> None:
+        """Close a segment's writer and make the segment web-compatible."""
+        writer.release()
+        if not segment.path.endswith(".mp4"):
+            mp4_path = os.path.splitext(segment.path)[0] + ".mp4"
+            transcode_to_mp4(segment.path, mp4_path, preset="veryfast", crf=self.crf)
+            os.remove(segment.path)
+            segment.path = mp4_path
+        segment.finalized = True
+        self._write_manifest()
+
+    def _write_manifest(self) -> None:
+        with self._manifest_lock:
+            manifest = [asdict(segment) for segment in self.segments if segment.finalized]
+            with open(self.segment_dir / "segments.json", "w") as f:
+                json.dump(manifest, f, indent=2)
+
+    def release(self) -> None:
+        """Finalise the last segment and wait for all pending segments.
+        
+        Raises:
+            subprocess.CalledProcessError: If a segment could not be finalised
+            RuntimeError: If a segment lost frames
+        """
+        self._close_current()
+        self._executor.shutdown(wait=True)
+        error = None
+        for future in self._pending:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error finalising segment: {e}")
+                error = error or e
+        if isinstance(error, (subprocess.CalledProcessError, RuntimeError)):
+            raise error
+
+    def join(self, output_file: str) -> None:
+        """Join the finalised segments into one MP4 with a stream copy.
+        
+        Args:
+            output_file (str): Path of the joined MP4 file
+            
+        Raises:
+            subprocess.CalledProcessError: If ffmpeg fails
+        """
+        list_file = self.segment_dir / "segments.txt"
+        with open(list_file, "w") as f:
+            for segment in self.segments:
+                if segment.finalized:
+                    path = Path(segment.path).resolve().as_posix().replace("'", "'\\''")
+                    f.write(f"file '{path}'\n")
+        subprocess.run([
+            'ffmpeg', '-f', 'concat', '-safe', '0',
+            '-i', str(list_file),
+            '-c', 'copy',  # No re-encoding, segments share encoder settings
+            '-movflags', '+faststart',
+            '-y', output_file
+        ], check=True, capture_output=True)
+
 
 class ScreenRecorder:
-    def __init__(self, output_dir: str = "recordings"):
+    def __init__(self, output_dir: str = "recordings", fps: float = 30.0, buffer_size: int = 64,
+                 buffer_bytes: int = 256 * 1024 * 1024,
+                 encoder: str = "ffmpeg", change_threshold: Optional[float] = None,
+                 diff_stride: int = 8, step_detector: Optional[StepDetector] = None,
+                 region: Optional[Tuple[int, int, int, int]] = None, scale: float = 1.0,
+                 segment_seconds: Optional[float] = None, quality: int = 80,
+                 adaptive: bool = True, min_fps: float = 5.0,
+                 on_step: Optional[Callable[[Step], None]] = None):
         """Initialize the screen recorder.
         
         Args:
             output_dir (str): Directory to save recordings
+            fps (float): Target capture frame rate
+            buffer_size (int): Number of frames buffered between capture and encoding
+            buffer_bytes (int): Memory the capture and detection buffers may each
+                hold; at 4K this allows only a few frames
+            encoder (str): "ffmpeg" to stream frames straight into an H.264 MP4,
+                or "opencv" to write an XVID AVI that is transcoded on stop
+            change_threshold (Optional[float]): Enables change-aware capture. A grab
+                whose mean absolute difference (0-255) from the last kept frame is
+                below this value is dropped, so only keyframes are written, each
+                shown from its true capture time (see ``start_recording``).
+                None records every frame.
+            diff_stride (int): Pixel stride of the downsampled grid used for the
+                change check
+            step_detector (Optional[StepDetector]): If given, written frames are
+                also fed to an online step detector while recording, and the
+                detected steps are available in ``detected_steps`` on stop
+            region (Optional[Tuple[int, int, int, int]]): Screen rectangle to capture
+                as (left, top, width, height) in virtual-screen coordinates, e.g.
+                from ``window_region``. None captures the whole monitor.
+            scale (float): Downscale factor applied to captured frames before
+                encoding (e.g. 0.5 halves width and height)
+            segment_seconds (Optional[float]): Write the recording as segments of
+                this length, finalised in the background and joined on stop.
+                Requires ffmpeg. None writes a single file.
+            quality (int): Encoding quality (1-100, higher is better); 80 matches
+                the x264 default CRF of 23
+            adaptive (bool): Lower the frame rate when grabbing or encoding cannot
+                keep up with ``fps`` and raise it again when it can. Needs the
+                ffmpeg encoder, which stamps each frame with the time it is
+                written; the OpenCV encoder writes at a fixed rate, so the rate
+                stays at ``fps`` there.
+            min_fps (float): Lowest frame rate the adaptive controller may use
+            on_step (Optional[Callable[[Step], None]]): Called from the detector
+                thread with each step as soon as it is confirmed, so screenshots
+                and descriptions can be produced while recording continues
         """
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
         self.recording = False
+        self.fps = fps
+        self.buffer_size = buffer_size
+        self.buffer_bytes = buffer_bytes
+        self.encoder = encoder
+        self.change_threshold = change_threshold
+        self.diff_stride = diff_stride
+        self.step_detector = step_detector
+        self.on_step = on_step
+        self.region = region
+        self.scale = scale
+        self.frame_size = None
+        self.segment_seconds = segment_seconds
+        self.segments: List[Segment] = []
+        self._segmented = None
+        self.quality = quality
+        self.crf = quality_to_crf(quality)
+        self.adaptive = adaptive
+        self.min_fps = min_fps
+        self.rate_controller = RateController(fps, min_fps)
+        self.detected_steps: List[Step] = []
+        self._temp_output = None
+        self._encoder_error = None
+        self._spool = None
+        self._thread = None
         self._lock = threading.Lock()
+        self._idle = threading.Event()
+        self._idle.set()
         self.frames = []
-        self.timestamps = []
+        self._index_writer = None
+        self.stats = RecordingStats()
 
     def start_recording(self, monitor: int = 1) -> None:
         """Start screen recording continuously until stopped.
+
+        The calling thread grabs frames on an absolute deadline schedule and
+        pushes them into a ring buffer; a separate encoder thread converts and
+        writes them to the video file.
+
+        With ``change_threshold`` set, grabs that do not differ from the last
+        kept frame are dropped before encoding. With ffmpeg the video then
+        holds only keyframes, each stamped with its arrival time at the encoder
+        (variable frame rate); other writers repeat the last keyframe at the
+        nominal rate. Either way playback follows the real session timeline,
+        and the timestamp sidecar carries the capture time of every frame in
+        the file.
+        
+        Args:
+            monitor (int): Monitor number to record (default: 1, primary monitor)
+        """
+        self._idle.clear()
+        self.stats = RecordingStats()
+        self._encoder_error = None
+        self.detected_steps = []
+        self.rate_controller = RateController(self.fps, self.min_fps)
+        buffer = FrameRingBuffer(self.buffer_size, self.buffer_bytes)
+        detection_buffer = None
+        threads = []
+        out = None
+        try:
+            with mss.mss() as sct:  # Create new mss instance in this thread
+                self.recording = True
+                monitor = self._capture_area(sct.monitors[monitor])  # Get capture area once
+                self.frame_size = (
+                    max(1, int(round(monitor["width"] * self.scale))),
+                    max(1, int(round(monitor["height"] * self.scale)))
+                )
+
+                # Create a video writer object for continuous recording
+                out, output_file = self._open_recording_writer()
+                self._temp_output = output_file
+                # Frame timestamps are streamed to a sidecar next to the video
+                self._index_writer = TimestampIndexWriter(sidecar_path(output_file))
+                # A fixed-rate file would play back too fast once the rate drops
+                adaptive = self.adaptive and self._timed_writer(out)
+                if self.adaptive and not adaptive:
+                    print("Adaptive frame rate needs the ffmpeg encoder, recording at a fixed rate")
+
+                if self.step_detector is not None:
+                    detection_buffer = FrameRingBuffer(self.buffer_size, self.buffer_bytes)
+                    # The recording can't be read back until it is finalised, so
+                    # step screenshots are spilled next to it instead of kept in memory
+                    online = self.step_detector.online(
+                        spool_dir=str(self.output_dir / f"step_frames_{time.strftime('%Y%m%d_%H%M%S')}"))
+                    self._spool = online.spool
+                    threads.append(threading.Thread(
+                        target=self._detect_steps, args=(detection_buffer, online), daemon=True))
+                threads.insert(0, threading.Thread(
+                    target=self._encode_frames, args=(buffer, out, detection_buffer), daemon=True))
+                for thread in threads:
+                    thread.start()
+
+                # Start recording loop, pacing grabs against absolute deadlines
+                controller = self.rate_controller
+                interval = 1.0 / controller.fps
+                deadline = time.perf_counter()
+                last_sample = None
+                # The encoder thread sets _encoder_error if writing fails
+                while self.recording and self._encoder_error is None:
+                    timestamp = time.time()
+                    grab_start = time.perf_counter()
+                    frame = np.array(sct.grab(monitor))
+                    controller.record_grab(time.perf_counter() - grab_start)
+                    self.stats.frames_captured += 1
+
+                    if self.change_threshold is None:
+                        buffer.put((timestamp, frame), frame.nbytes)
+                    else:
+                        # Cheap change check on a strided subsample of the grab
+                        sample = frame[::self.diff_stride, ::self.diff_stride, :3]
+                        if last_sample is None or self._frame_changed(sample, last_sample):
+                            buffer.put((timestamp, frame), frame.nbytes)
+                            last_sample = sample
+                        else:
+                            self.stats.unchanged_frames += 1
+
+                    if adaptive:
+                        interval = 1.0 / controller.update()
+                    deadline += interval
+                    now = time.perf_counter()
+                    if now > deadline:
+                        # Grab overran its slot: count it and skip the missed slots
+                        self.stats.late_frames += 1
+                        deadline += int((now - deadline) / interval) * interval
+                    else:
+                        time.sleep(deadline - now)
+        finally:
+            # Let the encoder and detector drain their buffers, then release the
+            # video writer, also when the loop is interrupted (e.g. Ctrl+C)
+            buffer.close()
+            for thread in threads:
+                thread.join()
+            # Frames discarded by the buffer or left unwritten after an encoder failure
+            self.stats.dropped_frames = (self.stats.frames_captured - self.stats.unchanged_frames
+                                         - self.stats.frames_written)
+            if detection_buffer is not None:
+                self.stats.detection_dropped_frames = detection_buffer.dropped
+            if out is not None:
+                try:
+                    out.release()
+                except (subprocess.CalledProcessError, RuntimeError) as e:
+                    self._encoder_error = self._encoder_error or e
+                self._index_writer.close()
+                if self._encoder_error is None:
+                    print(f"Recording stopped. Video saved at {self._temp_output}")
+                else:
+                    print(f"Recording failed: {self._encoder_error}")
+            self.recording = False
+            self._idle.set()
+
+    def start_recording_async(self, monitor: int = 1) -> threading.Thread:
+        """Start recording on a background thread owned by the recorder.
         
         Args:
             monitor (int): Monitor number to record (default: 1, primary monitor)
+            
+        Returns:
+            threading.Thread: The capture thread, joined by ``stop_recording``
         """
-        with mss.mss() as sct:  # Create new mss instance in this thread
-            self.recording = True
-            monitor = sct.monitors[monitor]  # Get monitor info once
-            screen_width = monitor["width"]
-            screen_height = monitor["height"]
+        self._idle.clear()
+        self._thread = threading.Thread(target=self.start_recording, args=(monitor,), daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def _capture_area(self, monitor: dict) -> dict:
+        """Get the rectangle to grab, clipped to the selected monitor.
+        
+        Args:
+            monitor (dict): mss monitor description
             
-            # Set up the codec for video saving
-            fourcc = cv2.VideoWriter_fourcc(*'XVID')
+        Returns:
+            dict: mss-style rectangle with left, top, width and height
+        """
+        if self.region is None:
+            return monitor
+        left, top, width, height = self.region
+        right = min(left + width, monitor["left"] + monitor["width"])
+        bottom = min(top + height, monitor["top"] + monitor["height"])
+        left = max(left, monitor["left"])
+        top = max(top, monitor["top"])
+        if right <= left or bottom <= top:
+            raise ValueError(f"Capture region {self.region} is outside the selected monitor")
+        return {"left": left, "top": top, "width": right - left, "height": bottom - top}
+
+    @staticmethod
+    def window_region(title: str) -> Tuple[int, int, int, int]:
+        """Find the screen rectangle of a window, for use as a capture region.
+
+        Requires the optional ``pygetwindow`` package.
+        
+        Args:
+            title (str): Text contained in the window title
             
-            # Create a video writer object for continuous recording
-            timestamp = time.strftime("%Y%m%d_%H%M%S")
-            output_file = str(self.output_dir / f"temp.avi")
-            out = cv2.VideoWriter(output_file, fourcc, 30.0, (screen_width, screen_height))
-            # Start recording loop
-            while self.recording:
-                timestamp = time.time()
-                frame = np.array(sct.grab(monitor))
-                frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
-                self.timestamps.append(timestamp)
+        Returns:
+            Tuple[int, int, int, int]: Window rectangle as (left, top, width, height)
+        """
+        try:
+            import pygetwindow
+        except ImportError:
+            raise ImportError("Window capture requires the optional 'pygetwindow' package") from None
+        windows = [w for w in pygetwindow.getWindowsWithTitle(title) if w.width > 0 and w.height > 0]
+        if not windows:
+            raise ValueError(f"No window found with a title containing {title!r}")
+        window = windows[0]
+        return window.left, window.top, window.width, window.height
+
+    def _frame_changed(self, sample: np.ndarray, last_sample: np.ndarray) -> bool:
+        """Check whether a downsampled grab differs from the last kept one.
+        
+        Args:
+            sample (np.ndarray): Subsampled pixels of the new grab
+            last_sample (np.ndarray): Subsampled pixels of the last kept frame
+            
+        Returns:
+            bool: True if the mean absolute difference reaches the change threshold
+        """
+        return cv2.absdiff(sample, last_sample).mean() >= self.change_threshold
 
-                # Write the current frame to the video file
+    def _open_recording_writer(self):
+        """Create the writer for a new recording, segmented if configured.
+        
+        Returns:
+            Tuple[writer, str]: Video writer and the path of the recording
+        """
+        self._segmented = None
+        self.segments = []
+        if self.segment_seconds:
+            if FFmpegPipeWriter.available():
+                segment_dir = self.output_dir / f"segments_{time.strftime('%Y%m%d_%H%M%S')}"
+                self._segmented = SegmentedWriter(str(segment_dir), self._open_writer, self.segment_seconds,
+                                                  fps=lambda: self.rate_controller.fps, crf=self.crf)
+                self.segments = self._segmented.segments
+                # Segments are joined into this file when recording stops
+                return self._segmented, str(segment_dir / "recording.mp4")
+            print("FFmpeg not found, recording a single file instead of segments")
+        # Named per recording, as the raw file may outlive the recorder's next run
+        return self._open_writer(str(self.output_dir / f"temp_{time.strftime('%Y%m%d_%H%M%S')}"))
+
+    def _open_writer(self, base_path: str, fps: Optional[float] = None):
+        """Create the video writer for the configured encoder.
+        
+        Args:
+            base_path (str): Output path without extension
+            fps (Optional[float]): Frame rate of the file, defaults to the target rate
+            
+        Returns:
+            Tuple[writer, str]: Video writer and the path it writes to
+        """
+        fps = fps or self.fps
+        if self.encoder == "ffmpeg":
+            if FFmpegPipeWriter.available():
+                output_file = base_path + ".mp4"
+                return FFmpegPipeWriter(output_file, fps, self.frame_size, crf=self.crf,
+                                        vfr=self.change_threshold is not None or self.adaptive), output_file
+            print("FFmpeg not found, falling back to OpenCV encoder")
+
+        # Set up the codec for video saving
+        fourcc = cv2.VideoWriter_fourcc(*'XVID')
+        output_file = base_path + ".avi"
+        writer = cv2.VideoWriter(output_file, fourcc, fps, self.frame_size)
+        writer.set(cv2.VIDEOWRITER_PROP_QUALITY, self.quality)
+        return writer, output_file
+
+    def _timed_writer(self, out) -> bool:
+        """Check whether a writer stamps frames with real times rather than a fixed rate."""
+        if isinstance(out, SegmentedWriter):
+            # Segments are only written when ffmpeg is available
+            return self.encoder == "ffmpeg"
+        return isinstance(out, FFmpegPipeWriter)
+
+    def _encode_frames(self, buffer: FrameRingBuffer, out,
+                       detection_buffer: Optional[FrameRingBuffer] = None) -> None:
+        """Encoder thread: convert buffered frames and write them to the video.
+        
+        Args:
+            buffer (FrameRingBuffer): Buffer filled by the capture thread
+            out: Open ``cv2.VideoWriter`` or ``FFmpegPipeWriter``
+            detection_buffer (Optional[FrameRingBuffer]): Buffer feeding the online
+                step detector with written frames
+        """
+        first_timestamp = None
+        last_frame = None
+        last_timestamp = None
+        file_frames = 0
+        # Keyframe-only recordings keep their timing: ffmpeg stamps each frame as
+        # it arrives (variable frame rate), other writers repeat the last frame
+        hold = self.change_threshold is not None and not isinstance(out, (FFmpegPipeWriter, SegmentedWriter))
+
+        def write(frame: np.ndarray, timestamp: float, roll: bool = True) -> None:
+            nonlocal file_frames
+            if isinstance(out, SegmentedWriter):
+                out.write(frame, timestamp, roll)
+            else:
                 out.write(frame)
+            # Only frames that reach the file get a timestamp, so indices stay aligned
+            self._index_writer.append(timestamp, file_frames)
+            file_frames += 1
 
-                time.sleep(1 / 30)  # ~30 FPS (control the frame rate)
+        try:
+            while True:
+                item = buffer.get()
+                if item is None:
+                    break
+                timestamp, frame = item
+                if first_timestamp is None:
+                    first_timestamp = timestamp
+                encode_start = time.perf_counter()
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+                if self.scale != 1.0:
+                    frame = cv2.resize(frame, self.frame_size, interpolation=cv2.INTER_AREA)
+                try:
+                    if hold and last_frame is not None:
+                        for slot in self._hold_slots(last_timestamp, timestamp):
+                            write(last_frame, slot)
+                    elif (self.change_threshold is not None and last_frame is not None
+                          and isinstance(out, SegmentedWriter) and out.due(timestamp)):
+                        # End the segment with the held keyframe so it lasts until this one
+                        write(last_frame, timestamp, roll=False)
+                    write(frame, timestamp)
+                except OSError as e:
+                    # The encoder died (e.g. ffmpeg exited); stop the capture loop
+                    self._encoder_error = e
+                    break
+                self.rate_controller.record_encode(time.perf_counter() - encode_start)
+                self.stats.frames_written += 1
+                last_frame, last_timestamp = frame, timestamp
+                if detection_buffer is not None:
+                    detection_buffer.put((timestamp, frame, file_frames - 1), frame.nbytes)
+                if timestamp > first_timestamp:
+                    self.stats.effective_fps = (self.stats.frames_written - 1) / (timestamp - first_timestamp)
+                    
+            if self.change_threshold is not None and last_frame is not None and self._encoder_error is None:
+                # Show the last keyframe until recording stopped, so the video
+                # lasts as long as the session did
+                stop_time = time.time()
+                try:
+                    if hold:
+                        for slot in self._hold_slots(last_timestamp, stop_time):
+                            write(last_frame, slot)
+                    else:
+                        write(last_frame, stop_time, roll=False)
+                except OSError as e:
+                    self._encoder_error = e
+        finally:
+            if detection_buffer is not None:
+                detection_buffer.close()
 
-            # Release the video writer when the recording is stopped
+    def _hold_slots(self, start: float, end: float) -> List[float]:
+        """Timestamps of the frame slots strictly between two keyframes at the nominal rate.
+        
+        Args:
+            start (float): Capture time of the keyframe being held
+            end (float): Capture time of the next keyframe
+            
+        Returns:
+            List[float]: Timestamps at which to repeat the held keyframe
+        """
+        count = int(round((end - start) * self.fps)) - 1
+        return [start + (i + 1) / self.fps for i in range(max(0, count))]
+
+    def _detect_steps(self, buffer: FrameRingBuffer, online) -> None:
+        """Detector thread: feed written frames to the online step detector.
+        
+        Args:
+            buffer (FrameRingBuffer): Buffer filled by the encoder thread
+            online (OnlineStepDetector): Incremental detector to feed
+        """
+        while True:
+            item = buffer.get()
+            if item is None:
+                break
+            timestamp, frame, frame_index = item
+            online.push(frame, timestamp, frame_index)
+            self._report_steps(online.pop_confirmed())
+        self._report_steps(online.pop_confirmed(final=True))
+        self.detected_steps = online.finish()
 
-            out.release()
-            print(f"Recording stopped. Video saved at {output_file}")
+    def _report_steps(self, steps: List[Step]) -> None:
+        """Pass newly confirmed steps to the ``on_step`` callback."""
+        if self.on_step is None:
+            return
+        for step in steps:
+            try:
+                self.on_step(step)
+            except Exception as e:
+                print(f"Error handling detected step: {e}")
 
-    def stop_recording(self) -> Tuple[str, list]:
+    def stop_recording(self) -> Tuple[str, TimestampIndex]:
         """Stop recording and save the video.
         
         Returns:
-            Tuple[str, list]: Path to saved video and list of timestamps
+            Tuple[str, TimestampIndex]: Path to saved video and its memory-mapped
+                frame timestamps (an empty list if no timestamps were recorded)
+        """
+        return self.stop_recording_async().result()
+
+    def stop_recording_async(self, keep_raw: bool = False) -> FinalizeJob:
+        """Stop recording and finalise the video on the background worker pool.
+
+        Returns once the capture threads have exited and the raw file is
+        closed. The returned job reports conversion progress and yields the
+        same result as ``stop_recording``.
+        
+        Args:
+            keep_raw (bool): If the recording has to be transcoded, expose the
+                raw file as ``raw_path`` for early step detection and keep it
+                until ``FinalizeJob.release_raw`` is called
+        
+        Returns:
+            FinalizeJob: Handle to poll for progress and the final video
         """
         self.recording = False
-        time.sleep(0.1)  # Give recording thread time to stop
+        # Wait for the capture loop to drain the buffer and close the file
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+            if self._thread.is_alive():
+                print("Warning: recording thread did not stop in time")
+            self._thread = None
+        elif not self._idle.wait(timeout=30):
+            print("Warning: recording thread did not stop in time")
+        if self.stats.frames_captured:
+            print(f"Recording stats: {self.stats}")
                 
         timestamp = time.strftime("%Y%m%d_%H%M%S")
-        temp_output = str(self.output_dir / f"temp.avi")
-        timestamps = self.timestamps.copy()
+        temp_output = self._temp_output or str(self.output_dir / f"temp.avi")
         final_output = str(self.output_dir / f"recording_{timestamp}.mp4")
+        if self._temp_output is None and os.path.exists(sidecar_path(temp_output)):
+            # Converting a file this recorder did not record: drop any stale sidecar
+            os.remove(sidecar_path(temp_output))
                 
         self.frames = []
-        self.timestamps = []
+        self._index_writer = None
+        self._temp_output = None
+        segmented, self._segmented = self._segmented, None
+        encoder_error, self._encoder_error = self._encoder_error, None
+        spool, self._spool = self._spool, None
+        # Keyframe-only recordings don't have one frame per slot; read their length from the file
+        duration = (self.stats.frames_written / self.fps
+                    if self.stats.frames_written and self.change_threshold is None else None)
+
+        # Only a single non-MP4 file is transcoded; anything else is ready at once
+        transcode = segmented is None and encoder_error is None and not temp_output.endswith(".mp4")
+        raw_path = temp_output if keep_raw and transcode else None
+        raw_timestamps = TimestampIndex.for_video(temp_output) if raw_path else None
+        return FinalizeJob(self._finalize, temp_output, final_output, segmented, duration,
+                           encoder_error, raw_path is not None, list(self.detected_steps), spool,
+                           raw_path=raw_path, raw_timestamps=raw_timestamps)
+
+    def _finalize(self, job: FinalizeJob, temp_output: str, final_output: str,
+                  segmented: Optional[SegmentedWriter], duration: Optional[float],
+                  encoder_error: Optional[Exception] = None, keep_raw: bool = False,
+                  steps: Optional[List[Step]] = None, spool: Optional[FrameSpool] = None):
+        """Produce the final video and move spilled step screenshots onto it (runs on the worker pool).
+        
+        Once the video exists, steps detected while recording read their
+        frames from it and the spool of screenshots is deleted. If
+        finalising fails, the spool is kept along with the incomplete output.
+        
+        Args:
+            job (FinalizeJob): Job to report progress to
+            temp_output (str): Path the video was recorded to
+            final_output (str): Path of the final MP4
+            segmented (Optional[SegmentedWriter]): Writer holding the segments, if any
+            duration (Optional[float]): Duration of the recorded video in seconds
+            encoder_error (Optional[Exception]): Error that stopped the encoder
+                during recording, if any
+            keep_raw (bool): Leave the recorded file in place after transcoding
+            steps (Optional[List[Step]]): Steps detected while recording
+            spool (Optional[FrameSpool]): Spool holding their screenshots
+            
+        Returns:
+            Tuple[str, TimestampIndex]: Path to saved video and its timestamps
+        """
+        video_path, timestamps = self._finalize_video(job, temp_output, final_output, segmented,
+                                                      duration, encoder_error, keep_raw)
+        if video_path and spool is not None:
+            # Frame indices count frames written to the file, so they index the final video too
+            for step in steps or []:
+                if isinstance(step.frame_ref, FileFrameRef):
+                    step.frame_ref = VideoFrameRef(video_path, step.frame_index)
+            spool.cleanup()
+        return video_path, timestamps
+
+    def _finalize_video(self, job: FinalizeJob, temp_output: str, final_output: str,
+                        segmented: Optional[SegmentedWriter], duration: Optional[float],
+                        encoder_error: Optional[Exception] = None, keep_raw: bool = False):
+        """Produce the final web-compatible video.
+        
+        Args:
+            job (FinalizeJob): Job to report progress to
+            temp_output (str): Path the video was recorded to
+            final_output (str): Path of the final MP4
+            segmented (Optional[SegmentedWriter]): Writer holding the segments, if any
+            duration (Optional[float]): Duration of the recorded video in seconds
+            encoder_error (Optional[Exception]): Error that stopped the encoder
+                during recording, if any
+            keep_raw (bool): Leave the recorded file in place after transcoding,
+                for ``FinalizeJob.release_raw`` to remove
+            
+        Returns:
+            Tuple[str, TimestampIndex]: Path to saved video and its timestamps
+            
+        Raises:
+            RuntimeError: If the encoder failed, leaving an incomplete recording
+        """
+        if encoder_error is not None:
+            # The file is truncated (e.g. an MP4 without its index); keep it for
+            # inspection but don't pass it off as a recording
+            kept = segmented.segment_dir if segmented is not None else temp_output
+            raise RuntimeError(f"Recording failed, incomplete output kept at {kept}: "
+                               f"{_describe_error(encoder_error)}")
+        if segmented is not None:
+            # Segments are already finalised; join them without re-encoding
+            try:
+                segmented.join(final_output)
+            except subprocess.CalledProcessError as e:
+                print(f"FFmpeg error joining segments in {segmented.segment_dir}: {e.stderr.decode()}")
+                return None, []
+            timestamps = self._load_timestamps(temp_output, final_output)
+            shutil.rmtree(segmented.segment_dir, ignore_errors=True)
+            return final_output, timestamps
+
+        # Streamed recordings are already web-compatible MP4
+        if temp_output.endswith(".mp4"):
+            os.replace(temp_output, final_output)
+            return final_output, self._load_timestamps(temp_output, final_output)
         
         # Convert to web-compatible MP4 using ffmpeg
-                    
-        import subprocess
         try:
-            # Ensure the conversion is done with web-compatible settings
-            subprocess.run([
-                'ffmpeg', '-i', temp_output,
-                '-c:v', 'libx264',  # Use H.264 codec
-                '-preset', 'medium',  # Balance between speed and quality
-                '-crf', '23',  # Quality level (lower is better, 23 is default)
-                '-movflags', '+faststart',  # Enable fast start for web playback
-                '-y',  # Overwrite output file if it exists
-                final_output
-            ], check=True, capture_output=True)
+            if duration is None:
+                cap = cv2.VideoCapture(temp_output)
+                fps = cap.get(cv2.CAP_PROP_FPS)
+                duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / fps if fps else None
+                cap.release()
+            transcode_to_mp4(temp_output, final_output, crf=self.crf, duration=duration,
+                             on_progress=job.update)
             
-            # Remove temporary file
-            import os
-            os.remove(temp_output)
+            # Remove temporary file, unless steps may still be read from it
+            if not keep_raw:
+                try:
+                    os.remove(temp_output)
+                except OSError as e:
+                    print(f"Could not remove {temp_output}: {e}")
             
-            return final_output, timestamps
+            return final_output, self._load_timestamps(temp_output, final_output)
         except subprocess.CalledProcessError as e:
             print(f"FFmpeg error: {e.stderr.decode()}")
             # If ffmpeg fails, return the original AVI file
-            import shutil
-            shutil.move(temp_output, final_output)
-            return final_output, timestamps
+            if keep_raw:
+                shutil.copyfile(temp_output, final_output)
+            else:
+                shutil.move(temp_output, final_output)
+            return final_output, self._load_timestamps(temp_output, final_output)
         except Exception as e:
             print(f"Error during conversion: {e}")
-            return temp_output, timestamps
+            return temp_output, self._load_timestamps(temp_output, temp_output)
+
+    def _load_timestamps(self, temp_output: str, final_output: str):
+        """Move the timestamp sidecar next to the final video and open it.
+        
+        Args:
+            temp_output (str): Path the video was recorded to
+            final_output (str): Path of the saved video
+            
+        Returns:
+            TimestampIndex or list: Memory-mapped timestamps, or an empty list
+                if the recording has no sidecar
+        """
+        if temp_output != final_output and not move_sidecar(temp_output, final_output):
+            return []
+        index = TimestampIndex.for_video(final_output)
+        return index if index is not None else []
         
 #        return "Recording stopped and saved.", []
 
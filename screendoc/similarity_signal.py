@@ -0,0 +1,141 @@
+import json
+import os
+import numpy as np
+from pathlib import Path
+from typing import Optional
+
+# Per frame: similarity to the previous frame (NaN for the first frame) and timestamp
+SIGNAL_DTYPE = np.dtype([("similarity", "<f4"), ("timestamp", "<f8")])
+SUFFIX = ".similarity"
+
+
+def _signal_paths(video_path: str):
+    video_path = Path(video_path)
+    base = video_path.name + SUFFIX
+    return (video_path.with_name(base + ".npy"),
+            video_path.with_name(base + ".thumbs.npy"),
+            video_path.with_name(base + ".json"))
+
+
+class SimilaritySignal:
+    """Similarity of every frame of a video to the frame before it.
+
+    Computing it means decoding the whole video; once it exists, steps can be
+    selected for any threshold up to ``ceiling`` without touching the video.
+    Thumbnails are kept for the frames that could become steps, i.e. those
+    whose similarity is below ``ceiling``. The signal is cached as ``.npy``
+    files next to the video.
+    """
+
+    def __init__(self, records: np.ndarray, thumbnails: np.ndarray, ceiling: float,
+                 thumbnail_size: Optional[int]):
+        """Wrap a computed signal.
+
+        Args:
+            records (np.ndarray): Per-frame records of ``SIGNAL_DTYPE``
+            thumbnails (np.ndarray): Stacked thumbnails of the frames listed by
+                ``thumbnail_indices``
+            ceiling (float): Similarity below which frames have a thumbnail
+            thumbnail_size (Optional[int]): Thumbnail size the signal was computed at
+        """
+        self.records = records
+        self.thumbnails = thumbnails
+        self.ceiling = ceiling
+        self.thumbnail_size = thumbnail_size
+        self.thumbnail_indices = self.candidates(ceiling)
+        self._positions = {int(idx): pos for pos, idx in enumerate(self.thumbnail_indices)}
+
+    @property
+    def similarities(self) -> np.ndarray:
+        """np.ndarray: Similarity of each frame to the previous one."""
+        return self.records["similarity"]
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        """np.ndarray: Timestamp of each frame."""
+        return self.records["timestamp"]
+
+    def candidates(self, threshold: float) -> np.ndarray:
+        """Find the frames that differ enough from the frame before them.
+
+        Args:
+            threshold (float): Similarity threshold
+
+        Returns:
+            np.ndarray: Indices of the first frame and of frames whose
+                similarity is below the threshold
+        """
+        similarities = self.similarities
+        return np.flatnonzero(np.isnan(similarities) | (similarities < threshold))
+
+    def thumbnail(self, frame_index: int) -> np.ndarray:
+        """Get the thumbnail of a candidate frame.
+
+        Args:
+            frame_index (int): Index of a frame below the ceiling
+
+        Returns:
+            np.ndarray: Grayscale thumbnail
+        """
+        return self.thumbnails[self._positions[frame_index]]
+
+    def covers(self, threshold: float, thumbnail_size: Optional[int]) -> bool:
+        """Check whether steps for a threshold can be selected from this signal."""
+        return threshold <= self.ceiling and thumbnail_size == self.thumbnail_size
+
+    def save(self, video_path: str) -> None:
+        """Write the signal next to a video.
+
+        Args:
+            video_path (str): Path to the video the signal was computed from
+        """
+        records_path, thumbs_path, meta_path = _signal_paths(video_path)
+        np.save(records_path, self.records)
+        np.save(thumbs_path, self.thumbnails)
+        stat = os.stat(video_path)
+        with open(meta_path, "w") as f:
+            json.dump({
+                "ceiling": self.ceiling,
+                "thumbnail_size": self.thumbnail_size,
+                "video_size": stat.st_size,
+                "video_mtime": stat.st_mtime
+            }, f)
+
+    @staticmethod
+    def remove(video_path: str) -> None:
+        """Delete the signal cached next to a video, if any.
+        
+        Args:
+            video_path (str): Path to the video
+        """
+        for path in _signal_paths(video_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    @classmethod
+    def for_video(cls, video_path: str) -> Optional["SimilaritySignal"]:
+        """Load the signal cached next to a video.
+
+        Args:
+            video_path (str): Path to the video
+
+        Returns:
+            Optional[SimilaritySignal]: The signal, or None if there is none or
+                the video has changed since it was computed
+        """
+        records_path, thumbs_path, meta_path = _signal_paths(video_path)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            stat = os.stat(video_path)
+            if meta["video_size"] != stat.st_size or meta["video_mtime"] != stat.st_mtime:
+                return None
+            records = np.load(records_path, mmap_mode="r")
+            thumbnails = np.load(thumbs_path, mmap_mode="r")
+        except (OSError, ValueError, KeyError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"Ignoring unreadable similarity cache for {video_path}: {e}")
+            return None
+        return cls(records, thumbnails, meta["ceiling"], meta["thumbnail_size"])
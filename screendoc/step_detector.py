@@ -1,27 +1,163 @@
+import os
+import multiprocessing
 import cv2
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Tuple, Dict
-from dataclasses import dataclass
+from typing import List, Tuple, Dict, Iterator, Optional, Sequence
 from datetime import datetime
+from .timestamp_index import TimestampIndex
+from .image_hash import BKTree, dhash
+from .frame_store import FrameRef, FrameSpool, VideoFrameRef
+from .similarity_signal import SIGNAL_DTYPE, SimilaritySignal
+
+# File extension and OpenCV quality flag of each screenshot format
+SCREENSHOT_FORMATS = {
+    "png": (".png", cv2.IMWRITE_PNG_COMPRESSION),
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+
+# Lowest similarity ceiling of a cached signal, so nearby thresholds reuse it
+SIGNAL_CEILING = 0.95
 
-@dataclass
 class Step:
-    timestamp: float
-    screenshot: np.ndarray
-    description: str = ""
-    similarity_score: float = 0.0
+    """A detected step.
+
+    The screenshot is either held in memory or, if ``frame_ref`` is set,
+    loaded from the video or file it refers to each time it is accessed, so
+    a session's steps take little memory however many there are.
+    """
+
+    __slots__ = ("timestamp", "_screenshot", "frame_ref", "description", "similarity_score",
+                 "frame_index", "thumbnail", "image_hash", "change_regions")
+
+    def __init__(self, timestamp: float, screenshot: Optional[np.ndarray] = None, description: str = "",
+                 similarity_score: float = 0.0, frame_index: int = -1, thumbnail: Optional[np.ndarray] = None,
+                 image_hash: Optional[int] = None, frame_ref: Optional[FrameRef] = None,
+                 change_regions: Optional[List[Tuple[float, float, float, float]]] = None):
+        """Initialize the step.
+        
+        Args:
+            timestamp (float): Time of the step in the recording
+            screenshot (Optional[np.ndarray]): Screenshot in BGR format, if kept in memory
+            description (str): Description of the step
+            similarity_score (float): Similarity to the frame before the step
+            frame_index (int): Index of the step's frame in the video
+            thumbnail (Optional[np.ndarray]): Small grayscale copy of the
+                screenshot used for similarity checks
+            image_hash (Optional[int]): Perceptual hash of the screenshot used to
+                find earlier duplicates
+            frame_ref (Optional[FrameRef]): Where to load the screenshot from
+                when it is not kept in memory
+            change_regions (Optional[List[Tuple[float, float, float, float]]]):
+                Bounding boxes (x, y, width, height) of what changed since the
+                previous step, as fractions of the screenshot's width and height
+        """
+        self.timestamp = timestamp
+        self._screenshot = screenshot
+        self.frame_ref = frame_ref
+        self.description = description
+        self.similarity_score = similarity_score
+        self.frame_index = frame_index
+        self.thumbnail = thumbnail
+        self.image_hash = image_hash
+        self.change_regions = change_regions if change_regions is not None else []
+
+    @property
+    def screenshot(self) -> Optional[np.ndarray]:
+        """Optional[np.ndarray]: Screenshot in BGR format, loaded on access if
+        it is only referenced."""
+        if self._screenshot is None and self.frame_ref is not None:
+            return self.frame_ref.load()
+        return self._screenshot
+
+    @screenshot.setter
+    def screenshot(self, screenshot: Optional[np.ndarray]) -> None:
+        self._screenshot = screenshot
+
+    def __repr__(self) -> str:
+        return (f"Step(timestamp={self.timestamp!r}, frame_index={self.frame_index!r}, "
+                f"similarity_score={self.similarity_score!r}, description={self.description!r})")
 
 class StepDetector:
-    def __init__(self, similarity_threshold: float = 0.85, min_time_between_steps: float = 1.0):
+    def __init__(self, similarity_threshold: float = 0.85, min_time_between_steps: float = 1.0,
+                 thumbnail_size: Optional[int] = 160, sample_interval: Optional[float] = None,
+                 hash_distance: Optional[int] = 10, workers: Optional[int] = 1,
+                 cache_signal: bool = False, region_threshold: int = 25,
+                 min_region_area: float = 0.0005):
         """Initialize the step detector.
         
         Args:
             similarity_threshold (float): Threshold for detecting significant changes (0-1)
             min_time_between_steps (float): Minimum time between steps in seconds
+            thumbnail_size (Optional[int]): Longest edge in pixels of the grayscale
+                thumbnails frames are compared on. None compares at full resolution.
+            sample_interval (Optional[float]): Seconds between frames compared by
+                ``detect_steps``. Frames in between are still decoded by
+                ``grab()``, but not converted, thumbnailed or compared. When two
+                samples differ, a second reader decodes forward to the skipped
+                frames to find the exact transition, so a video with changes
+                throughout is decoded twice. Changes that revert within one
+                interval are missed. None compares every frame.
+            hash_distance (Optional[int]): Largest Hamming distance between the
+                64-bit perceptual hashes of a candidate and an earlier step for
+                the two to be compared as possible duplicates. Lets a screen
+                revisited at any point in the session be recognised. None only
+                checks the last 3 steps.
+            workers (Optional[int]): Processes ``detect_steps`` decodes the video
+                with. With more than one, the video is split into frame ranges
+                that are scanned in parallel and the results merged in order,
+                giving the same steps as the serial scan. ``sample_interval`` is
+                ignored in this mode. None uses every CPU core.
+            cache_signal (bool): Store each frame's similarity to the previous
+                frame next to the video (see ``SimilaritySignal``), so running
+                ``detect_steps`` again with other thresholds or minimum times
+                doesn't decode the video. ``sample_interval`` is ignored.
+            region_threshold (int): Smallest grayscale difference (0-255) between
+                consecutive steps' thumbnails counted as a change
+            min_region_area (float): Smallest changed region to report, as a
+                fraction of the screen area
         """
         self.similarity_threshold = similarity_threshold
         self.min_time_between_steps = min_time_between_steps
+        self.thumbnail_size = thumbnail_size
+        self.sample_interval = sample_interval
+        self.hash_distance = hash_distance
+        self.workers = workers
+        self.cache_signal = cache_signal
+        self.region_threshold = region_threshold
+        self.min_region_area = min_region_area
+
+    def make_thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        """Reduce a frame to the grayscale thumbnail used for comparisons.
+        
+        Args:
+            frame (np.ndarray): Frame in BGR format
+            
+        Returns:
+            np.ndarray: Grayscale thumbnail
+        """
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        height, width = gray.shape
+        if self.thumbnail_size and max(height, width) > self.thumbnail_size:
+            factor = self.thumbnail_size / max(height, width)
+            size = (max(1, int(round(width * factor))), max(1, int(round(height * factor))))
+            gray = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+        return gray
+
+    def step_thumbnail(self, step: Step) -> np.ndarray:
+        """Get a step's thumbnail, computing and caching it on first use.
+        
+        Args:
+            step (Step): Detected step
+            
+        Returns:
+            np.ndarray: Grayscale thumbnail of the step's screenshot
+        """
+        if step.thumbnail is None:
+            step.thumbnail = self.make_thumbnail(step.screenshot)
+        return step.thumbnail
         
     def calculate_similarity(self, frame1: np.ndarray, frame2: np.ndarray) -> float:
         """Calculate structural similarity between two frames.
@@ -33,109 +169,740 @@ class StepDetector:
         Returns:
             float: Similarity score between 0 and 1
         """
-        # Convert frames to grayscale
-        gray1 = cv2.cvtColor(frame1, cv2.COLOR_BGR2GRAY)
-        gray2 = cv2.cvtColor(frame2, cv2.COLOR_BGR2GRAY)
+        return self.thumbnail_similarity(self.make_thumbnail(frame1), self.make_thumbnail(frame2))
+
+    def thumbnail_similarity(self, thumb1: np.ndarray, thumb2: np.ndarray) -> float:
+        """Calculate similarity between two thumbnails from ``make_thumbnail``.
         
-        # Calculate SSIM
+        Args:
+            thumb1 (np.ndarray): First thumbnail
+            thumb2 (np.ndarray): Second thumbnail
+            
+        Returns:
+            float: Similarity score between 0 and 1
+        """
         try:
-            score = cv2.matchTemplate(gray1, gray2, cv2.TM_CCOEFF_NORMED)[0][0]
+            score = cv2.matchTemplate(thumb1, thumb2, cv2.TM_CCOEFF_NORMED)[0][0]
             return max(0.0, min(1.0, score))  # Ensure score is between 0 and 1
         except:
             return 0.0
             
-    def detect_steps(self, video_path: str, timestamps: List[float]) -> List[Step]:
+    def change_regions(self, thumb1: np.ndarray, thumb2: np.ndarray) -> List[Tuple[float, float, float, float]]:
+        """Find the regions that differ between two thumbnails.
+        
+        Args:
+            thumb1 (np.ndarray): Thumbnail of the earlier frame
+            thumb2 (np.ndarray): Thumbnail of the later frame
+            
+        Returns:
+            List[Tuple[float, float, float, float]]: Bounding boxes (x, y, width,
+                height) as fractions of the frame size, largest first
+        """
+        height, width = thumb2.shape
+        if thumb1.shape != thumb2.shape:
+            thumb1 = cv2.resize(thumb1, (width, height), interpolation=cv2.INTER_AREA)
+        diff = cv2.absdiff(thumb1, thumb2)
+        _, mask = cv2.threshold(diff, self.region_threshold, 255, cv2.THRESH_BINARY)
+        # Join nearby changed pixels, e.g. the characters of a line of text
+        mask = cv2.dilate(mask, np.ones((3, 3), np.uint8))
+        count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        
+        regions = []
+        for x, y, w, h, area in sorted(stats[1:count].tolist(), key=lambda stat: -stat[4]):
+            if area >= self.min_region_area * width * height:
+                regions.append((x / width, y / height, w / width, h / height))
+        return regions
+
+    def online(self, video_path: Optional[str] = None, spool_dir: Optional[str] = None) -> "OnlineStepDetector":
+        """Create an incremental detector that uses this detector's settings.
+        
+        Args:
+            video_path (Optional[str]): Video the frames come from. Steps then
+                refer to their frame in it instead of keeping a copy.
+            spool_dir (Optional[str]): Directory to spill step screenshots to,
+                for frames whose video cannot be read back yet
+        
+        Returns:
+            OnlineStepDetector: Detector to be fed frames as they are captured
+        """
+        spool = FrameSpool(spool_dir) if spool_dir else None
+        return OnlineStepDetector(self, video_path=video_path, spool=spool)
+
+    def detect_steps(self, video_path: str, timestamps: Optional[Sequence[float]] = None) -> List[Step]:
         """Detect significant steps in a recorded video.
         
         Args:
             video_path (str): Path to the recorded video
-            timestamps (List[float]): List of frame timestamps
+            timestamps (Optional[Sequence[float]]): Frame timestamps. Defaults to the
+                timestamp sidecar stored next to the video, or to the video's own
+                frame positions if there is none.
             
         Returns:
             List[Step]: List of detected steps
         """
+        return list(self.iter_steps(video_path, timestamps))
+
+    def iter_steps(self, video_path: str, timestamps: Optional[Sequence[float]] = None) -> Iterator[Step]:
+        """Detect steps in a recorded video, yielding each as soon as it is confirmed.
+        
+        A candidate is confirmed once the next candidate has been found, since
+        the neighbor filter compares it with both. The steps are the same as
+        those returned by ``detect_steps``, with their changed regions set.
+        
+        Args:
+            video_path (str): Path to the recorded video
+            timestamps (Optional[Sequence[float]]): Frame timestamps, as for
+                ``detect_steps``
+            
+        Yields:
+            Step: Detected steps in order
+        """
+        if timestamps is None:
+            timestamps = TimestampIndex.for_video(video_path)
+        workers = self.workers or os.cpu_count() or 1
+        if self.cache_signal:
+            signal = SimilaritySignal.for_video(video_path)
+            if signal is None or not signal.covers(self.similarity_threshold, self.thumbnail_size):
+                ceiling = max(self.similarity_threshold, SIGNAL_CEILING)
+                signal = self.compute_signal(video_path, timestamps, ceiling, workers)
+                signal.save(video_path)
+            yield from self._iter_signal_steps(signal, video_path, timestamps)
+            return
+        online = self.online(video_path)
+        if workers > 1 and len(self._frame_ranges(video_path, timestamps, workers)) > 1:
+            # Select from each range's signal as soon as it is scanned
+            for start, records, thumbnails in self._scan_chunks(video_path, timestamps,
+                                                                self.similarity_threshold, workers):
+                chunk = SimilaritySignal(records, thumbnails, self.similarity_threshold, self.thumbnail_size)
+                yield from self._push_signal(online, chunk, timestamps, start)
+            yield from online.pop_confirmed(final=True)
+            return
         cap = cv2.VideoCapture(video_path)
-        steps = []
-        prev_frame = None
-        prev_timestamp = 0
         frame_idx = 0
+        prev_sample = None
+        next_sample_time = None
+        # Reader trailing the sampled one, for frames skipped between samples;
+        # seeking back by frame index is slow and lands wrong in variable-rate video
+        trailing = None
+        trailing_idx = 0
         
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
+        # grab() only demuxes/decodes; pixels are copied out by retrieve()
+        while cap.grab():
+            timestamp = self._frame_timestamp(cap, timestamps, frame_idx)
+            if timestamp is None:
+                print(f"Warning: {video_path} has more frames than timestamps, "
+                      f"stopping at frame {frame_idx}")
                 break
+            if next_sample_time is not None and timestamp < next_sample_time:
+                # Skip frames between samples without retrieving them
+                frame_idx += 1
+                continue
                 
-            current_timestamp = timestamps[frame_idx]
-            
-            if prev_frame is None:
-                # First frame is always a step
-                steps.append(Step(
-                    timestamp=current_timestamp,
-                    screenshot=frame.copy(),
-                    similarity_score=1.0
-                ))
-            else:
-                # Check time difference
-                time_diff = current_timestamp - prev_timestamp
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            thumbnail = self.make_thumbnail(frame)
+            
+            if self.sample_interval:
+                if (prev_sample is not None and frame_idx - prev_sample[0] > 1 and
+                        self.thumbnail_similarity(prev_sample[1], thumbnail) < self.similarity_threshold):
+                    # The screen changed since the last sample: decode the skipped
+                    # frames so the exact transition frame is found
+                    if trailing is None:
+                        trailing = cv2.VideoCapture(video_path)
+                    trailing_idx = self._push_range(trailing, trailing_idx, timestamps, online,
+                                                    prev_sample[0] + 1, frame_idx)
+                prev_sample = (frame_idx, thumbnail)
+                next_sample_time = timestamp + self.sample_interval
                 
-                if time_diff >= self.min_time_between_steps:
-                    # Calculate similarity with previous frame
-                    similarity = self.calculate_similarity(prev_frame, frame)
-                    
-                    # If significant change detected
-                    if similarity < self.similarity_threshold:
-                        # Calculate similarity with all recent steps to avoid duplicates
-                        is_unique = True
-                        for recent_step in steps[-3:]:  # Check last 3 steps
-                            if self.calculate_similarity(recent_step.screenshot, frame) > self.similarity_threshold:
-                                is_unique = False
-                                break
-                                
-                        if is_unique:
-                            steps.append(Step(
-                                timestamp=current_timestamp,
-                                screenshot=frame.copy(),
-                                similarity_score=similarity
-                            ))
-                            prev_timestamp = current_timestamp
-            
-            prev_frame = frame.copy()
+            online.push(frame, timestamp, frame_idx, thumbnail)
             frame_idx += 1
+            yield from online.pop_confirmed()
             
         cap.release()
+        if trailing is not None:
+            trailing.release()
+        yield from online.pop_confirmed(final=True)
+
+    def _frame_ranges(self, video_path: str, timestamps: Optional[Sequence[float]],
+                      workers: int) -> List[Tuple[int, Optional[int]]]:
+        """Split a video into frame ranges to scan in parallel.
         
-        # Filter out steps that are too similar to their neighbors
-        filtered_steps = []
-        for i, step in enumerate(steps):
-            if i == 0 or i == len(steps) - 1:  # Keep first and last steps
-                filtered_steps.append(step)
+        Args:
+            video_path (str): Path to the video
+            timestamps (Optional[Sequence[float]]): Frame timestamps, if known
+            workers (int): Number of worker processes
+            
+        Returns:
+            List[Tuple[int, Optional[int]]]: (start, end) frame ranges; an end of
+                None reads to the end of the video. A single range if the video
+                is short or its frame count unknown.
+        """
+        cap = cv2.VideoCapture(video_path)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+        if timestamps is not None:
+            frame_count = min(frame_count, len(timestamps)) if frame_count > 0 else len(timestamps)
+            
+        # A few ranges per worker so uneven decoding cost still balances out, but
+        # long enough that seeking to each range's keyframe stays cheap
+        chunks = min(workers * 4, frame_count // 500) if workers > 1 else 1
+        if chunks < 2:
+            return [(0, len(timestamps) if timestamps is not None else None)]
+        bounds = [frame_count * i // chunks for i in range(chunks + 1)]
+        ranges = [(bounds[i], bounds[i + 1]) for i in range(chunks)]
+        if timestamps is None:
+            # The last range reads on to the end in case the frame count is short
+            ranges[-1] = (ranges[-1][0], None)
+        return ranges
+
+    def compute_signal(self, video_path: str, timestamps: Optional[Sequence[float]] = None,
+                       ceiling: Optional[float] = None, workers: int = 1) -> SimilaritySignal:
+        """Compute each frame's similarity to the frame before it.
+        
+        With more than one worker, frame ranges of the video are scanned in a
+        process pool and merged in order, giving the same signal as a single
+        scan.
+        
+        Args:
+            video_path (str): Path to the video
+            timestamps (Optional[Sequence[float]]): Frame timestamps, if known
+            ceiling (Optional[float]): Similarity below which frames keep a
+                thumbnail; defaults to the similarity threshold
+            workers (int): Number of worker processes
+            
+        Returns:
+            SimilaritySignal: The video's similarity signal
+        """
+        if ceiling is None:
+            ceiling = self.similarity_threshold
+        results = list(self._scan_chunks(video_path, timestamps, ceiling, workers))
+        records = np.concatenate([chunk_records for _, chunk_records, _ in results])
+        thumbnails = [chunk_thumbnails for _, _, chunk_thumbnails in results if len(chunk_thumbnails)]
+        thumbnails = np.concatenate(thumbnails) if thumbnails else _stack([])
+        return SimilaritySignal(records, thumbnails, ceiling, self.thumbnail_size)
+
+    def _scan_chunks(self, video_path: str, timestamps: Optional[Sequence[float]], ceiling: float,
+                     workers: int) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+        """Scan the video's frame ranges, in a process pool if there are several.
+        
+        Args:
+            video_path (str): Path to the video
+            timestamps (Optional[Sequence[float]]): Frame timestamps, if known
+            ceiling (float): Similarity below which frames keep a thumbnail
+            workers (int): Number of worker processes
+            
+        Yields:
+            Tuple[int, np.ndarray, np.ndarray]: First frame, signal records and
+                stacked thumbnails of each range, in video order
+        """
+        jobs = []
+        for start, end in self._frame_ranges(video_path, timestamps, workers):
+            chunk_timestamps = None
+            if timestamps is not None:
+                chunk_timestamps = np.asarray(timestamps[max(start - 1, 0):end], dtype=np.float64)
+            jobs.append((self, video_path, start, end, chunk_timestamps, ceiling))
+            
+        frame_count = 0
+        if len(jobs) == 1:
+            chunk_records, chunk_thumbnails = _scan_frame_range(*jobs[0])
+            frame_count += len(chunk_records)
+            yield 0, chunk_records, _stack(chunk_thumbnails)
+        else:
+            # Spawn rather than fork: callers such as the Streamlit app have other
+            # threads running, and a forked child could inherit a held lock
+            with ProcessPoolExecutor(max_workers=min(workers, len(jobs)),
+                                     mp_context=multiprocessing.get_context("spawn")) as pool:
+                futures = [pool.submit(_scan_frame_range, *job) for job in jobs]
+                # Yield in video order so the result doesn't depend on scheduling
+                for job, future in zip(jobs, futures):
+                    chunk_records, chunk_thumbnails = future.result()
+                    frame_count += len(chunk_records)
+                    yield job[2], chunk_records, _stack(chunk_thumbnails)
+                    
+        if timestamps is not None and frame_count == len(timestamps):
+            cap = cv2.VideoCapture(video_path)
+            if cap.get(cv2.CAP_PROP_FRAME_COUNT) > len(timestamps):
+                print(f"Warning: {video_path} has more frames than timestamps, "
+                      f"stopping at frame {len(timestamps)}")
+            cap.release()
+
+    def select_steps(self, signal: SimilaritySignal, video_path: str,
+                     timestamps: Optional[Sequence[float]] = None) -> List[Step]:
+        """Select steps from a precomputed similarity signal.
+        
+        Frames at or above the similarity threshold are dropped in one array
+        operation; only the remaining candidates go through the minimum-time,
+        duplicate and neighbor rules, without decoding the video.
+        
+        Args:
+            signal (SimilaritySignal): Signal covering this detector's threshold
+            video_path (str): Path to the video the signal was computed from
+            timestamps (Optional[Sequence[float]]): Frame timestamps, defaults
+                to those stored in the signal
+            
+        Returns:
+            List[Step]: List of detected steps
+        """
+        return list(self._iter_signal_steps(signal, video_path, timestamps))
+
+    def _iter_signal_steps(self, signal: SimilaritySignal, video_path: str,
+                           timestamps: Optional[Sequence[float]]) -> Iterator[Step]:
+        """Yield the steps ``select_steps`` selects as they are confirmed."""
+        online = self.online(video_path)
+        yield from self._push_signal(online, signal, timestamps)
+        yield from online.pop_confirmed(final=True)
+
+    def _push_signal(self, online: "OnlineStepDetector", signal: SimilaritySignal,
+                     timestamps: Optional[Sequence[float]], offset: int = 0) -> Iterator[Step]:
+        """Feed the candidate frames of a signal to an incremental detector.
+        
+        Args:
+            online (OnlineStepDetector): Detector to feed
+            signal (SimilaritySignal): Signal of the video or of a range of it
+            timestamps (Optional[Sequence[float]]): Frame timestamps, defaults
+                to those stored in the signal
+            offset (int): Frame index of the signal's first frame
+            
+        Yields:
+            Step: Steps confirmed along the way
+        """
+        similarities = signal.similarities
+        for position in signal.candidates(self.similarity_threshold):
+            position = int(position)
+            frame_index = offset + position
+            if timestamps is not None and frame_index < len(timestamps):
+                timestamp = timestamps[frame_index]
             else:
-                # Check if this step is significantly different from both neighbors
-                prev_similarity = self.calculate_similarity(steps[i-1].screenshot, step.screenshot)
-                next_similarity = self.calculate_similarity(step.screenshot, steps[i+1].screenshot)
-                if prev_similarity < self.similarity_threshold and next_similarity < self.similarity_threshold:
-                    filtered_steps.append(step)
+                timestamp = float(signal.timestamps[position])
+            similarity = similarities[position]
+            similarity = None if np.isnan(similarity) else similarity
+            online.push_scored(timestamp, signal.thumbnail(position), similarity,
+                               frame_index=frame_index)
+            yield from online.pop_confirmed()
+
+    def _frame_timestamp(self, cap: cv2.VideoCapture, timestamps: Optional[Sequence[float]],
+                         frame_idx: int) -> Optional[float]:
+        """Get the timestamp of the frame the capture is positioned on.
         
-        return filtered_steps
+        Args:
+            cap (cv2.VideoCapture): Capture that has just grabbed the frame
+            timestamps (Optional[Sequence[float]]): Frame timestamps, if known
+            frame_idx (int): Index of the frame in the video
+            
+        Returns:
+            Optional[float]: Timestamp, or None if ``timestamps`` has run out
+        """
+        if timestamps is None:
+            return cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        if frame_idx < len(timestamps):
+            return timestamps[frame_idx]
+        return None
+
+    def _push_range(self, cap: cv2.VideoCapture, position: int, timestamps: Optional[Sequence[float]],
+                    online: "OnlineStepDetector", start: int, end: int) -> int:
+        """Decode and feed frames [start, end) that were skipped while sampling.
+
+        The capture only moves forward: frames before ``start`` are decoded
+        with ``grab()`` and not converted.
         
-    def save_screenshots(self, steps: List[Step], output_dir: str) -> Dict[int, str]:
+        Args:
+            cap (cv2.VideoCapture): Video capture trailing the sampling one
+            position (int): Index of the next frame ``cap`` will grab
+            timestamps (Optional[Sequence[float]]): Frame timestamps, if known
+            online (OnlineStepDetector): Detector to feed
+            start (int): First frame to decode; not before ``position``
+            end (int): Frame after the last one to decode
+            
+        Returns:
+            int: Index of the next frame ``cap`` will grab
+        """
+        while position < start and cap.grab():
+            position += 1
+        while position < end and cap.grab():
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            timestamp = self._frame_timestamp(cap, timestamps, position)
+            position += 1
+            if timestamp is None:
+                break
+            online.push(frame, timestamp, position - 1)
+        return position
+
+    def save_screenshots(self, steps: List[Step], output_dir: str, image_format: str = "png",
+                         quality: Optional[int] = None, max_size: Optional[int] = None,
+                         workers: Optional[int] = None) -> Dict[int, str]:
         """Save screenshots for each detected step.
         
+        Screenshots are loaded, scaled and encoded on a thread pool.
+        
         Args:
             steps (List[Step]): List of detected steps
             output_dir (str): Directory to save screenshots
+            image_format (str): "png", "jpeg" or "webp"
+            quality (Optional[int]): PNG compression level (0-9), or JPEG/WebP
+                quality (1-100). None uses OpenCV's default, except for WebP
+                where it means lossless.
+            max_size (Optional[int]): Longest edge in pixels; larger screenshots
+                are scaled down. None keeps the full resolution.
+            workers (Optional[int]): Encoder threads, defaults to the CPU count
             
         Returns:
             Dict[int, str]: Dictionary mapping step index to screenshot path
         """
+        # OpenCV releases the GIL while encoding, so threads run in parallel
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            paths = pool.map(lambda idx: self.save_screenshot(steps[idx], idx, output_dir, image_format,
+                                                              quality, max_size),
+                             range(len(steps)))
+            return dict(enumerate(paths))
+
+    def save_screenshot(self, step: Step, index: int, output_dir: str, image_format: str = "png",
+                        quality: Optional[int] = None, max_size: Optional[int] = None) -> str:
+        """Save the screenshot of one step, e.g. as soon as it is detected.
+        
+        Args:
+            step (Step): Detected step
+            index (int): Position of the step, used in the file name
+            output_dir (str): Directory to save the screenshot in
+            image_format (str): "png", "jpeg" or "webp"
+            quality (Optional[int]): Format quality, as for ``save_screenshots``
+            max_size (Optional[int]): Longest edge in pixels, or None
+            
+        Returns:
+            str: Path of the saved screenshot
+        """
+        if image_format not in SCREENSHOT_FORMATS:
+            raise ValueError(f"Unsupported screenshot format: {image_format}")
+        extension, quality_flag = SCREENSHOT_FORMATS[image_format]
+        if quality is None and image_format == "webp":
+            quality = 101  # Above 100 selects lossless WebP
+        params = [quality_flag, quality] if quality is not None else []
+        
         output_dir = Path(output_dir)
         output_dir.mkdir(parents=True, exist_ok=True)
+        timestamp = datetime.fromtimestamp(step.timestamp).strftime("%Y%m%d_%H%M%S")
+        output_path = str(output_dir / f"step_{index}_{timestamp}{extension}")
+        
+        screenshot = step.screenshot
+        height, width = screenshot.shape[:2]
+        if max_size and max(height, width) > max_size:
+            factor = max_size / max(height, width)
+            size = (max(1, int(round(width * factor))), max(1, int(round(height * factor))))
+            screenshot = cv2.resize(screenshot, size, interpolation=cv2.INTER_AREA)
+        if not cv2.imwrite(output_path, screenshot, params):
+            print(f"Error saving screenshot {output_path}")
+        return output_path
+
+
+class SimilarityMemo:
+    """Similarities between pairs of frames, each computed at most once.
+
+    Pairs are keyed by the frames' indices in the video, in the order they
+    were compared (earlier frame first), so duplicate suppression and the
+    neighbor filter can share results. Frames without an index (negative,
+    e.g. steps built by hand) are compared every time.
+    """
+
+    def __init__(self, detector: StepDetector):
+        """Initialize an empty memo.
+        
+        Args:
+            detector (StepDetector): Detector providing the similarity measure
+        """
+        self.detector = detector
+        self.computed = 0
+        self.avoided = 0
+        self._similarities = {}
+
+    def similarity(self, key1: int, thumb1: np.ndarray, key2: int, thumb2: np.ndarray) -> float:
+        """Get the similarity of two frames, computing it on first request.
+        
+        Args:
+            key1 (int): Frame index of the first frame
+            thumb1 (np.ndarray): Thumbnail of the first frame
+            key2 (int): Frame index of the second frame
+            thumb2 (np.ndarray): Thumbnail of the second frame
+            
+        Returns:
+            float: Similarity score between 0 and 1
+        """
+        if key1 < 0 or key2 < 0:
+            # No index to identify the frames by
+            self.computed += 1
+            return self.detector.thumbnail_similarity(thumb1, thumb2)
+        key = (key1, key2)
+        similarity = self._similarities.get(key)
+        if similarity is None:
+            similarity = self.detector.thumbnail_similarity(thumb1, thumb2)
+            self._similarities[key] = similarity
+            self.computed += 1
+        else:
+            self.avoided += 1
+        return similarity
+
+    def steps_similarity(self, step1: Step, step2: Step) -> float:
+        """Get the similarity of two steps' screenshots."""
+        detector = self.detector
+        return self.similarity(step1.frame_index, detector.step_thumbnail(step1),
+                               step2.frame_index, detector.step_thumbnail(step2))
+
+    def __str__(self) -> str:
+        return f"{self.computed} computed, {self.avoided} avoided"
+
+
+class OnlineStepDetector:
+    """Incremental step detection over frames fed one at a time.
+
+    Applies the same similarity threshold, minimum-time and duplicate rules as
+    ``StepDetector.detect_steps``, so a recorder can feed live frames and have
+    the steps ready as soon as recording stops. Each frame is reduced to a
+    thumbnail once; only thumbnails are kept between frames.
+    """
+
+    def __init__(self, detector: StepDetector, video_path: Optional[str] = None,
+                 spool: Optional[FrameSpool] = None):
+        """Initialize the incremental detector.
+        
+        Args:
+            detector (StepDetector): Detector providing thresholds and similarity
+            video_path (Optional[str]): Video the frames come from; steps refer
+                to their frame in it by index
+            spool (Optional[FrameSpool]): Spool to spill step screenshots to.
+                Without a video or spool, screenshots are copied into memory.
+        """
+        self.detector = detector
+        self.video_path = video_path
+        self.spool = spool
+        self.steps = []
+        self._prev_thumbnail = None
+        self._started = False
+        self._prev_timestamp = 0
+        self._frame_idx = 0
+        self._hash_index = BKTree()
+        self.memo = SimilarityMemo(detector)
+        self.kept = []
+        self._decided = 0
+        self._finished = False
+
+    def push(self, frame: np.ndarray, timestamp: float, frame_index: Optional[int] = None,
+             thumbnail: Optional[np.ndarray] = None) -> Optional[Step]:
+        """Process the next frame.
+        
+        Args:
+            frame (np.ndarray): Next frame in BGR format
+            timestamp (float): Capture time of the frame
+            frame_index (Optional[int]): Index of the frame in the video, if frames
+                may have been skipped; defaults to counting pushed frames
+            thumbnail (Optional[np.ndarray]): The frame's thumbnail, if the caller
+                has already computed it
+            
+        Returns:
+            Optional[Step]: The candidate step created for this frame, if any
+        """
+        detector = self.detector
+        if thumbnail is None:
+            thumbnail = detector.make_thumbnail(frame)
+        
+        # Only frames far enough from the last step need comparing
+        similarity = None
+        if (self._prev_thumbnail is not None and
+                timestamp - self._prev_timestamp >= detector.min_time_between_steps):
+            similarity = detector.thumbnail_similarity(self._prev_thumbnail, thumbnail)
+        self._prev_thumbnail = thumbnail
+        return self.push_scored(timestamp, thumbnail, similarity, frame, frame_index)
+
+    def push_scored(self, timestamp: float, thumbnail: np.ndarray, similarity: Optional[float],
+                    frame: Optional[np.ndarray] = None, frame_index: Optional[int] = None) -> Optional[Step]:
+        """Process the next frame given its similarity to the frame before it.
+        
+        Frames whose similarity is at or above the threshold can be left out,
+        as long as ``frame_index`` is given for the frames that are pushed.
         
-        screenshot_paths = {}
-        for idx, step in enumerate(steps):
-            timestamp = datetime.fromtimestamp(step.timestamp).strftime("%Y%m%d_%H%M%S")
-            output_path = str(output_dir / f"step_{idx}_{timestamp}.png")
-            cv2.imwrite(output_path, step.screenshot)
-            screenshot_paths[idx] = output_path
+        Args:
+            timestamp (float): Capture time of the frame
+            thumbnail (np.ndarray): The frame's thumbnail
+            similarity (Optional[float]): Similarity to the previous frame, or
+                None if it was not computed
+            frame (Optional[np.ndarray]): The frame in BGR format. May be None
+                if steps refer to frames in the video.
+            frame_index (Optional[int]): Index of the frame in the video
             
-        return screenshot_paths
+        Returns:
+            Optional[Step]: The candidate step created for this frame, if any
+        """
+        detector = self.detector
+        step = None
+        if frame_index is not None:
+            self._frame_idx = frame_index
+        
+        if not self._started:
+            # First frame is always a step
+            step = Step(
+                timestamp=timestamp,
+                similarity_score=1.0,
+                frame_index=self._frame_idx,
+                thumbnail=thumbnail
+            )
+        elif (similarity is not None and similarity < detector.similarity_threshold and
+                timestamp - self._prev_timestamp >= detector.min_time_between_steps):
+            # Significant change: keep it unless it repeats an earlier step
+            if self._is_unique(thumbnail):
+                step = Step(
+                    timestamp=timestamp,
+                    similarity_score=similarity,
+                    frame_index=self._frame_idx,
+                    thumbnail=thumbnail
+                )
+                self._prev_timestamp = timestamp
+        
+        if step is not None:
+            if self.video_path is not None:
+                step.frame_ref = VideoFrameRef(self.video_path, step.frame_index)
+            elif self.spool is not None:
+                step.frame_ref = self.spool.store(frame, step.frame_index)
+            else:
+                step.screenshot = frame.copy()
+            self.steps.append(step)
+            if detector.hash_distance is not None:
+                step.image_hash = dhash(thumbnail)
+                self._hash_index.add(step.image_hash, step)
+        self._started = True
+        self._frame_idx += 1
+        return step
+
+    def _is_unique(self, thumbnail: np.ndarray) -> bool:
+        """Check that a candidate does not repeat an earlier step.
+        
+        Compares against the last 3 steps and, if hashing is enabled, against
+        any earlier step whose perceptual hash is close to the candidate's.
+        
+        Args:
+            thumbnail (np.ndarray): Thumbnail of the candidate frame
+            
+        Returns:
+            bool: True if no earlier step is similar to the candidate
+        """
+        detector = self.detector
+        candidates = self.steps[-3:]
+        if detector.hash_distance is not None:
+            matches = self._hash_index.search(dhash(thumbnail), detector.hash_distance)
+            recent = {id(step) for step in candidates}
+            candidates = candidates + [step for _, step in matches if id(step) not in recent]
+        for earlier_step in candidates:
+            if self.memo.similarity(earlier_step.frame_index, detector.step_thumbnail(earlier_step),
+                                    self._frame_idx, thumbnail) > detector.similarity_threshold:
+                return False
+        return True
+
+    def pop_confirmed(self, final: bool = False) -> List[Step]:
+        """Take the steps confirmed since the last call.
+        
+        Applies the neighbor filter to every candidate whose successor is
+        known: a candidate is kept if it differs from both its neighbors, and
+        the first and last candidates are always kept. Confirmed steps get
+        their changed regions; dropped candidates release their spilled
+        screenshots.
+        
+        Args:
+            final (bool): No more frames will be pushed, so the last candidate
+                is confirmed too
+            
+        Returns:
+            List[Step]: Newly confirmed steps in order
+        """
+        detector = self.detector
+        steps = self.steps
+        confirmed = []
+        while self._decided < len(steps):
+            i = self._decided
+            step = steps[i]
+            if i == 0 or (final and i == len(steps) - 1):  # Keep first and last steps
+                keep = True
+            elif i + 1 < len(steps):
+                keep = (self.memo.steps_similarity(steps[i-1], step) < detector.similarity_threshold and
+                        self.memo.steps_similarity(step, steps[i+1]) < detector.similarity_threshold)
+            else:
+                break
+            self._decided += 1
+            
+            if keep:
+                if self.kept:
+                    step.change_regions = detector.change_regions(detector.step_thumbnail(self.kept[-1]),
+                                                                  detector.step_thumbnail(step))
+                else:
+                    step.change_regions = [(0.0, 0.0, 1.0, 1.0)]
+                self.kept.append(step)
+                confirmed.append(step)
+            elif self.spool is not None:
+                step.frame_ref.discard()
+                
+        if final and not self._finished:
+            self._finished = True
+            print(f"Step similarity comparisons: {self.memo}")
+        return confirmed
+
+    def finish(self) -> List[Step]:
+        """Confirm the remaining candidates.
+        
+        Returns:
+            List[Step]: All detected steps
+        """
+        self.pop_confirmed(final=True)
+        return list(self.kept)
+
+
+def _stack(thumbnails: List[np.ndarray]) -> np.ndarray:
+    """Stack equally sized thumbnails into one array."""
+    return np.stack(thumbnails) if thumbnails else np.zeros((0, 1, 1), dtype=np.uint8)
+
+
+def _scan_frame_range(detector: StepDetector, video_path: str, start: int, end: Optional[int],
+                      timestamps: Optional[np.ndarray], ceiling: float) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """Compute the similarity signal of a range of a video.
+    
+    Runs in a worker process for ``StepDetector.compute_signal``.
+    
+    Args:
+        detector (StepDetector): Detector providing thumbnails and similarity
+        video_path (str): Path to the video
+        start (int): First frame of the range
+        end (Optional[int]): Frame after the range, or None to read to the end
+        timestamps (Optional[np.ndarray]): Timestamps of the frames from
+            ``start - 1`` (or 0) up to ``end``, if known
+        ceiling (float): Similarity below which a frame's thumbnail is kept
+        
+    Returns:
+        Tuple[np.ndarray, List[np.ndarray]]: ``SIGNAL_DTYPE`` records of the
+            range's frames and the thumbnails of frames below the ceiling
+    """
+    cap = cv2.VideoCapture(video_path)
+    first = max(start - 1, 0)
+    if first:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, first)
+    records = []
+    thumbnails = []
+    prev_thumbnail = None
+    frame_idx = first
+    while end is None or frame_idx < end:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if timestamps is None:
+            timestamp = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        else:
+            timestamp = float(timestamps[frame_idx - first])
+        thumbnail = detector.make_thumbnail(frame)
+        if frame_idx >= start:
+            if prev_thumbnail is None:
+                similarity = np.nan
+            else:
+                similarity = detector.thumbnail_similarity(prev_thumbnail, thumbnail)
+            records.append((similarity, timestamp))
+            if prev_thumbnail is None or similarity < ceiling:
+                thumbnails.append(thumbnail)
+        prev_thumbnail = thumbnail
+        frame_idx += 1
+    cap.release()
+    return np.array(records, dtype=SIGNAL_DTYPE), thumbnails
@@ -0,0 +1,243 @@
+import os
+import shutil
+import struct
+import subprocess
+import cv2
+import numpy as np
+from pathlib import Path
+from typing import Iterable, Optional, Sequence, Union
+
+# Each record is the frame's index in the video followed by its timestamp
+RECORD_DTYPE = np.dtype([("frame_index", "<i8"), ("timestamp", "<f8")])
+HEADER = b"SDTSIDX1"
+SUFFIX = ".timestamps"
+
+
+def sidecar_path(video_path: str) -> str:
+    """Get the path of the timestamp sidecar for a video.
+
+    Args:
+        video_path (str): Path to the video file
+
+    Returns:
+        str: Path of the sidecar file next to the video
+    """
+    video_path = Path(video_path)
+    return str(video_path.with_name(video_path.name + SUFFIX))
+
+
+def move_sidecar(src_video: str, dst_video: str) -> bool:
+    """Move a video's timestamp sidecar along with the video.
+
+    Args:
+        src_video (str): Original path of the video
+        dst_video (str): New path of the video
+
+    Returns:
+        bool: True if a sidecar existed and was moved
+    """
+    src = sidecar_path(src_video)
+    if not os.path.exists(src):
+        return False
+    try:
+        os.replace(src, sidecar_path(dst_video))
+    except PermissionError:
+        # The sidecar is still memory-mapped (e.g. on Windows); copy it instead
+        shutil.copyfile(src, sidecar_path(dst_video))
+    return True
+
+
+class TimestampIndexWriter:
+    """Append-only writer for a binary frame timestamp sidecar.
+
+    Records are streamed to disk as they arrive, so a long recording does not
+    keep its timestamps in memory.
+    """
+
+    def __init__(self, path: str):
+        """Create the sidecar file.
+
+        Args:
+            path (str): Path of the sidecar file to write
+        """
+        self.path = path
+        self.count = 0
+        self._file = open(path, "wb")
+        self._file.write(HEADER)
+        self._record = struct.Struct("<qd")
+
+    def append(self, timestamp: float, frame_index: Optional[int] = None) -> None:
+        """Add the timestamp of the next frame.
+
+        Args:
+            timestamp (float): Frame timestamp in seconds
+            frame_index (Optional[int]): Index of the frame in the video,
+                defaults to the number of records written so far
+        """
+        if frame_index is None:
+            frame_index = self.count
+        self._file.write(self._record.pack(frame_index, timestamp))
+        self.count += 1
+
+    def close(self) -> None:
+        """Flush and close the sidecar file."""
+        if not self._file.closed:
+            self._file.close()
+
+
+class TimestampIndex(Sequence):
+    """Read-only, memory-mapped view of a video's frame timestamps.
+
+    Behaves like the list of timestamps it replaces: ``index[i]`` is the
+    timestamp of the i-th frame in the video.
+    """
+
+    def __init__(self, path: str):
+        """Open a timestamp sidecar.
+
+        Args:
+            path (str): Path of the sidecar file
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(HEADER)) != HEADER:
+                raise ValueError(f"Not a timestamp index: {path}")
+        count = (os.path.getsize(path) - len(HEADER)) // RECORD_DTYPE.itemsize
+        if count:
+            self._records = np.memmap(path, dtype=RECORD_DTYPE, mode="r",
+                                      offset=len(HEADER), shape=(count,))
+        else:
+            self._records = np.empty(0, dtype=RECORD_DTYPE)
+
+    @classmethod
+    def for_video(cls, video_path: str) -> Optional["TimestampIndex"]:
+        """Open the sidecar stored next to a video, if there is one.
+
+        Args:
+            video_path (str): Path to the video file
+
+        Returns:
+            Optional[TimestampIndex]: The index, or None if the video has no sidecar
+        """
+        path = sidecar_path(video_path)
+        if not os.path.exists(path):
+            return None
+        return cls(path)
+
+    @classmethod
+    def write(cls, video_path: str, timestamps: Iterable[float],
+              frame_indices: Optional[Iterable[int]] = None) -> "TimestampIndex":
+        """Write a complete sidecar for a video and open it.
+
+        Args:
+            video_path (str): Path to the video file
+            timestamps (Iterable[float]): Frame timestamps in seconds
+            frame_indices (Optional[Iterable[int]]): Matching frame indices,
+                defaults to 0, 1, 2, ...
+
+        Returns:
+            TimestampIndex: The newly written index
+        """
+        timestamps = np.asarray(timestamps, dtype="<f8")
+        records = np.empty(len(timestamps), dtype=RECORD_DTYPE)
+        records["timestamp"] = timestamps
+        if frame_indices is None:
+            records["frame_index"] = np.arange(len(timestamps))
+        else:
+            records["frame_index"] = np.asarray(frame_indices, dtype="<i8")
+        path = sidecar_path(video_path)
+        with open(path, "wb") as f:
+            f.write(HEADER)
+            f.write(records.tobytes())
+        return cls(path)
+
+    @classmethod
+    def from_video(cls, video_path: str, origin: float = 0.0) -> "TimestampIndex":
+        """Build and write the sidecar of an existing video from its metadata.
+
+        Timestamps come from the container (see ``probe_timestamps``), so no
+        frames are decoded.
+
+        Args:
+            video_path (str): Path to the video file
+            origin (float): Time added to every timestamp, e.g. the recording's
+                start time
+
+        Returns:
+            TimestampIndex: The newly written index
+        """
+        return cls.write(video_path, probe_timestamps(video_path) + origin)
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        """np.ndarray: Memory-mapped array of all timestamps."""
+        return self._records["timestamp"]
+
+    @property
+    def frame_indices(self) -> np.ndarray:
+        """np.ndarray: Memory-mapped array of all frame indices."""
+        return self._records["frame_index"]
+
+    def timestamp_of(self, frame_index: int) -> float:
+        """Look up the timestamp of a frame by its index in the video.
+
+        Args:
+            frame_index (int): Index of the frame in the video
+
+        Returns:
+            float: Timestamp of the frame
+        """
+        indices = self.frame_indices
+        pos = int(np.searchsorted(indices, frame_index))
+        if pos >= len(indices) or indices[pos] != frame_index:
+            raise KeyError(frame_index)
+        return float(self._records[pos]["timestamp"])
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __getitem__(self, idx: Union[int, slice]):
+        if isinstance(idx, slice):
+            return self.timestamps[idx]
+        return float(self._records[idx]["timestamp"])
+
+    def __repr__(self) -> str:
+        return f"TimestampIndex({self.path!r}, frames={len(self)})"
+
+
+def probe_timestamps(video_path: str) -> np.ndarray:
+    """Read per-frame timestamps from a video's container without decoding it.
+
+    Uses the presentation timestamps of the video packets reported by
+    ffprobe. If ffprobe is unavailable or reports nothing, timestamps are
+    derived from the container's frame rate and frame count.
+
+    Args:
+        video_path (str): Path to the video file
+
+    Returns:
+        np.ndarray: Frame timestamps in seconds, starting at 0, in display order
+    """
+    try:
+        result = subprocess.run([
+            'ffprobe', '-v', 'error',
+            '-select_streams', 'v:0',
+            '-show_entries', 'packet=pts_time',
+            '-of', 'csv=p=0',
+            video_path
+        ], check=True, capture_output=True, text=True)
+        pts = [float(line.strip().rstrip(','))
+               for line in result.stdout.splitlines()
+               if line.strip().rstrip(',') not in ('', 'N/A')]
+        if pts:
+            # Packets come in decode order; frames are shown in PTS order
+            timestamps = np.sort(np.asarray(pts, dtype="<f8"))
+            return timestamps - timestamps[0]
+    except (OSError, subprocess.CalledProcessError, ValueError) as e:
+        print(f"Could not probe packet timestamps, using frame rate instead: {e}")
+
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return np.arange(max(frame_count, 0), dtype="<f8") / fps